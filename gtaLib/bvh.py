@@ -0,0 +1,635 @@
+# bvh.py — DragonFF COL spatial index, Blender 2.79 port
+# Bounding volume hierarchy over ColModel triangles, spheres and boxes
+
+import sys
+from array import array
+from math import sqrt
+from struct import pack, unpack_from, calcsize
+
+PRIM_FACE = 0
+PRIM_SPHERE = 1
+PRIM_BOX = 2
+
+_INF = float("inf")
+_EPSILON = 1e-9
+_SAH_BINS = 12
+_HEADER = "<4sIIIIIII"
+_MAGIC = b"CBVH"
+_FILE_VERSION = 1
+
+
+# -------------------------------------------------------------------------
+def _sub(a, b):
+    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1],
+            a[2] * b[0] - a[0] * b[2],
+            a[0] * b[1] - a[1] * b[0])
+
+
+def _dist2(a, b):
+    dx = a[0] - b[0]
+    dy = a[1] - b[1]
+    dz = a[2] - b[2]
+    return dx * dx + dy * dy + dz * dz
+
+
+def _aabb_dist2(point, bmin, bmax):
+    d = 0.0
+    for i in range(3):
+        v = point[i]
+        if v < bmin[i]:
+            d += (bmin[i] - v) ** 2
+        elif v > bmax[i]:
+            d += (v - bmax[i]) ** 2
+    return d
+
+
+def _ray_aabb(origin, inv_dir, bmin, bmax, t_max):
+    t0 = 0.0
+    t1 = t_max
+    for i in range(3):
+        inv = inv_dir[i]
+        if inv == _INF or inv == -_INF:
+            # Ray parallel to the slab
+            if origin[i] < bmin[i] or origin[i] > bmax[i]:
+                return None
+            continue
+        near = (bmin[i] - origin[i]) * inv
+        far = (bmax[i] - origin[i]) * inv
+        if near > far:
+            near, far = far, near
+        if near > t0:
+            t0 = near
+        if far < t1:
+            t1 = far
+        if t0 > t1:
+            return None
+    return t0
+
+
+def _ray_triangle(origin, direction, a, b, c):
+    """Möller–Trumbore, returns distance along the ray or None"""
+    e1 = _sub(b, a)
+    e2 = _sub(c, a)
+    p = _cross(direction, e2)
+    det = _dot(e1, p)
+    if -_EPSILON < det < _EPSILON:
+        return None
+    inv_det = 1.0 / det
+    s = _sub(origin, a)
+    u = _dot(s, p) * inv_det
+    if u < 0.0 or u > 1.0:
+        return None
+    q = _cross(s, e1)
+    v = _dot(direction, q) * inv_det
+    if v < 0.0 or u + v > 1.0:
+        return None
+    t = _dot(e2, q) * inv_det
+    return t if t >= 0.0 else None
+
+
+def _ray_sphere(origin, direction, center, radius):
+    oc = _sub(origin, center)
+    a = _dot(direction, direction)
+    b = _dot(oc, direction)
+    c = _dot(oc, oc) - radius * radius
+    disc = b * b - a * c
+    if disc < 0.0:
+        return None
+    root = sqrt(disc)
+    t = (-b - root) / a
+    if t < 0.0:
+        t = (-b + root) / a
+    return t if t >= 0.0 else None
+
+
+def _closest_on_triangle(p, a, b, c):
+    """Closest point on triangle abc to p (Ericson, Real-Time Collision Detection 5.1.5)"""
+    ab = _sub(b, a)
+    ac = _sub(c, a)
+    ap = _sub(p, a)
+    d1 = _dot(ab, ap)
+    d2 = _dot(ac, ap)
+    if d1 <= 0.0 and d2 <= 0.0:
+        return a
+
+    bp = _sub(p, b)
+    d3 = _dot(ab, bp)
+    d4 = _dot(ac, bp)
+    if d3 >= 0.0 and d4 <= d3:
+        return b
+
+    vc = d1 * d4 - d3 * d2
+    if vc <= 0.0 and d1 >= 0.0 and d3 <= 0.0:
+        v = d1 / (d1 - d3)
+        return (a[0] + ab[0] * v, a[1] + ab[1] * v, a[2] + ab[2] * v)
+
+    cp = _sub(p, c)
+    d5 = _dot(ab, cp)
+    d6 = _dot(ac, cp)
+    if d6 >= 0.0 and d5 <= d6:
+        return c
+
+    vb = d5 * d2 - d1 * d6
+    if vb <= 0.0 and d2 >= 0.0 and d6 <= 0.0:
+        w = d2 / (d2 - d6)
+        return (a[0] + ac[0] * w, a[1] + ac[1] * w, a[2] + ac[2] * w)
+
+    va = d3 * d6 - d5 * d4
+    if va <= 0.0 and (d4 - d3) >= 0.0 and (d5 - d6) >= 0.0:
+        w = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        return (b[0] + (c[0] - b[0]) * w, b[1] + (c[1] - b[1]) * w, b[2] + (c[2] - b[2]) * w)
+
+    denom = 1.0 / (va + vb + vc)
+    v = vb * denom
+    w = vc * denom
+    return (a[0] + ab[0] * v + ac[0] * w,
+            a[1] + ab[1] * v + ac[1] * w,
+            a[2] + ab[2] * v + ac[2] * w)
+
+
+def _triangle_aabb_overlap(a, b, c, bmin, bmax):
+    """Separating axis test between a triangle and an AABB (Akenine-Möller)"""
+    center = [(bmin[i] + bmax[i]) * 0.5 for i in range(3)]
+    half = [(bmax[i] - bmin[i]) * 0.5 for i in range(3)]
+    v0 = _sub(a, center)
+    v1 = _sub(b, center)
+    v2 = _sub(c, center)
+    edges = (_sub(v1, v0), _sub(v2, v1), _sub(v0, v2))
+
+    # 9 edge cross axis tests
+    for e in edges:
+        for axis in ((0.0, -e[2], e[1]), (e[2], 0.0, -e[0]), (-e[1], e[0], 0.0)):
+            p0 = _dot(v0, axis)
+            p1 = _dot(v1, axis)
+            p2 = _dot(v2, axis)
+            r = half[0] * abs(axis[0]) + half[1] * abs(axis[1]) + half[2] * abs(axis[2])
+            if min(p0, p1, p2) > r or max(p0, p1, p2) < -r:
+                return False
+
+    # Box face normals
+    for i in range(3):
+        if min(v0[i], v1[i], v2[i]) > half[i] or max(v0[i], v1[i], v2[i]) < -half[i]:
+            return False
+
+    # Triangle normal
+    normal = _cross(edges[0], edges[1])
+    d = _dot(normal, v0)
+    r = half[0] * abs(normal[0]) + half[1] * abs(normal[1]) + half[2] * abs(normal[2])
+    return abs(d) <= r
+
+
+# -------------------------------------------------------------------------
+class BVHHit:
+    """Result of a BVH query"""
+
+    __slots__ = ["distance", "point", "kind", "model", "index"]
+
+    def __init__(self, distance, point, kind, model, index):
+        self.distance = distance
+        self.point = point
+        self.kind = kind
+        self.model = model
+        self.index = index
+
+    def __repr__(self):
+        return "BVHHit(distance={}, point={}, kind={}, model={}, index={})".format(
+            self.distance, self.point, self.kind, self.model, self.index)
+
+
+# -------------------------------------------------------------------------
+class ColBVH:
+    """Bounding volume hierarchy over the collision primitives of one or more ColModels"""
+
+    def __init__(self, leaf_size=4):
+        self.leaf_size = leaf_size
+
+        # Primitive data, faces first, then spheres, then boxes
+        self.face_count = 0
+        self.sphere_count = 0
+        self.box_count = 0
+        self.prim_model = array("i")
+        self.prim_index = array("i")
+        self.prim_data = array("f")    # 9 floats per face, 4 per sphere, 6 per box
+        self.prim_offset = array("i")
+        self.prim_bounds = array("f")  # min xyz, max xyz per primitive
+
+        # Flattened nodes; leaves have count > 0 and reference prim_order[start:start+count]
+        self.node_bounds = array("f")
+        self.node_left = array("i")
+        self.node_right = array("i")
+        self.node_start = array("i")
+        self.node_count = array("i")
+        self.prim_order = array("i")
+
+    # construction ---------------------------------------------------------
+
+    @classmethod
+    def from_model(cls, model, leaf_size=4):
+        return cls.from_models([model], leaf_size)
+
+    @classmethod
+    def from_models(cls, models, leaf_size=4):
+        bvh = cls(leaf_size)
+        faces = []
+        spheres = []
+        boxes = []
+        for model_idx, model in enumerate(models):
+            verts = model.mesh_verts
+            for i, f in enumerate(model.mesh_faces):
+                a, b, c = verts[f.a], verts[f.b], verts[f.c]
+                faces.append((model_idx, i, (a[0], a[1], a[2], b[0], b[1], b[2], c[0], c[1], c[2])))
+            for i, s in enumerate(model.spheres):
+                spheres.append((model_idx, i, (s.center[0], s.center[1], s.center[2], s.radius)))
+            for i, b in enumerate(model.boxes):
+                boxes.append((model_idx, i, tuple(b.min) + tuple(b.max)))
+
+        bvh.face_count = len(faces)
+        bvh.sphere_count = len(spheres)
+        bvh.box_count = len(boxes)
+
+        bounds = bvh.prim_bounds
+        for model_idx, idx, data in faces:
+            bvh._add_prim(model_idx, idx, data)
+            xs, ys, zs = data[0::3], data[1::3], data[2::3]
+            bounds.extend((min(xs), min(ys), min(zs), max(xs), max(ys), max(zs)))
+        for model_idx, idx, data in spheres:
+            bvh._add_prim(model_idx, idx, data)
+            x, y, z, r = data
+            bounds.extend((x - r, y - r, z - r, x + r, y + r, z + r))
+        for model_idx, idx, data in boxes:
+            bvh._add_prim(model_idx, idx, data)
+            bounds.extend((min(data[0], data[3]), min(data[1], data[4]), min(data[2], data[5]),
+                           max(data[0], data[3]), max(data[1], data[4]), max(data[2], data[5])))
+
+        bvh._build()
+        return bvh
+
+    def _add_prim(self, model_idx, idx, data):
+        self.prim_model.append(model_idx)
+        self.prim_index.append(idx)
+        self.prim_offset.append(len(self.prim_data))
+        self.prim_data.extend(data)
+
+    def _prim_kind(self, prim):
+        if prim < self.face_count:
+            return PRIM_FACE
+        if prim < self.face_count + self.sphere_count:
+            return PRIM_SPHERE
+        return PRIM_BOX
+
+    def _add_node(self, bmin, bmax):
+        self.node_bounds.extend(bmin)
+        self.node_bounds.extend(bmax)
+        self.node_left.append(-1)
+        self.node_right.append(-1)
+        self.node_start.append(0)
+        self.node_count.append(0)
+        return len(self.node_left) - 1
+
+    def _build(self):
+        pb = self.prim_bounds
+        count = len(self.prim_model)
+        centroids = [((pb[i * 6] + pb[i * 6 + 3]) * 0.5,
+                      (pb[i * 6 + 1] + pb[i * 6 + 4]) * 0.5,
+                      (pb[i * 6 + 2] + pb[i * 6 + 5]) * 0.5) for i in range(count)]
+        order = list(range(count))
+        if count == 0:
+            return
+
+        stack = [(self._add_node(*self._range_bounds(order, 0, count)), 0, count)]
+        while stack:
+            node, start, end = stack.pop()
+            n = end - start
+            split = self._find_split(order, start, end, centroids) if n > self.leaf_size else None
+            if split is None:
+                self.node_start[node] = start
+                self.node_count[node] = n
+                continue
+
+            axis, value = split
+            sub = order[start:end]
+            left = [p for p in sub if centroids[p][axis] < value]
+            right = [p for p in sub if centroids[p][axis] >= value]
+            if not left or not right:
+                # Degenerate split, fall back to the median
+                sub.sort(key=lambda p: centroids[p][axis])
+                left, right = sub[:n // 2], sub[n // 2:]
+            order[start:end] = left + right
+            mid = start + len(left)
+
+            left_node = self._add_node(*self._range_bounds(order, start, mid))
+            right_node = self._add_node(*self._range_bounds(order, mid, end))
+            self.node_left[node] = left_node
+            self.node_right[node] = right_node
+            stack.append((right_node, mid, end))
+            stack.append((left_node, start, mid))
+
+        self.prim_order = array("i", order)
+
+    def _range_bounds(self, order, start, end):
+        pb = self.prim_bounds
+        bmin = [_INF, _INF, _INF]
+        bmax = [-_INF, -_INF, -_INF]
+        for p in order[start:end]:
+            o = p * 6
+            for i in range(3):
+                if pb[o + i] < bmin[i]:
+                    bmin[i] = pb[o + i]
+                if pb[o + 3 + i] > bmax[i]:
+                    bmax[i] = pb[o + 3 + i]
+        return bmin, bmax
+
+    def _find_split(self, order, start, end, centroids):
+        """Binned surface area heuristic over the widest centroid axis"""
+        sub = order[start:end]
+        cmin = [min(centroids[p][i] for p in sub) for i in range(3)]
+        cmax = [max(centroids[p][i] for p in sub) for i in range(3)]
+        extents = [cmax[i] - cmin[i] for i in range(3)]
+        axis = extents.index(max(extents))
+        if extents[axis] <= 0.0:
+            return None
+
+        pb = self.prim_bounds
+        scale = _SAH_BINS / extents[axis]
+        bin_count = [0] * _SAH_BINS
+        bin_min = [[_INF] * 3 for _ in range(_SAH_BINS)]
+        bin_max = [[-_INF] * 3 for _ in range(_SAH_BINS)]
+        for p in sub:
+            b = min(int((centroids[p][axis] - cmin[axis]) * scale), _SAH_BINS - 1)
+            bin_count[b] += 1
+            o = p * 6
+            bmin = bin_min[b]
+            bmax = bin_max[b]
+            for i in range(3):
+                if pb[o + i] < bmin[i]:
+                    bmin[i] = pb[o + i]
+                if pb[o + 3 + i] > bmax[i]:
+                    bmax[i] = pb[o + 3 + i]
+
+        def area(bmin, bmax):
+            d = [max(bmax[i] - bmin[i], 0.0) for i in range(3)]
+            return d[0] * d[1] + d[1] * d[2] + d[2] * d[0]
+
+        # Sweep from the right to accumulate suffix areas
+        right_area = [0.0] * _SAH_BINS
+        right_count = [0] * _SAH_BINS
+        rmin = [_INF] * 3
+        rmax = [-_INF] * 3
+        n = 0
+        for b in range(_SAH_BINS - 1, 0, -1):
+            n += bin_count[b]
+            rmin = [min(rmin[i], bin_min[b][i]) for i in range(3)]
+            rmax = [max(rmax[i], bin_max[b][i]) for i in range(3)]
+            right_area[b] = area(rmin, rmax)
+            right_count[b] = n
+
+        best_cost = _INF
+        best_bin = None
+        lmin = [_INF] * 3
+        lmax = [-_INF] * 3
+        n = 0
+        for b in range(_SAH_BINS - 1):
+            n += bin_count[b]
+            lmin = [min(lmin[i], bin_min[b][i]) for i in range(3)]
+            lmax = [max(lmax[i], bin_max[b][i]) for i in range(3)]
+            if n == 0 or right_count[b + 1] == 0:
+                continue
+            cost = n * area(lmin, lmax) + right_count[b + 1] * right_area[b + 1]
+            if cost < best_cost:
+                best_cost = cost
+                best_bin = b
+
+        if best_bin is None:
+            return axis, cmin[axis] + extents[axis] * 0.5
+        return axis, cmin[axis] + (best_bin + 1) / scale
+
+    # primitive helpers ----------------------------------------------------
+
+    def _face(self, prim):
+        o = self.prim_offset[prim]
+        d = self.prim_data
+        return (d[o], d[o + 1], d[o + 2]), (d[o + 3], d[o + 4], d[o + 5]), (d[o + 6], d[o + 7], d[o + 8])
+
+    def _node_bounds(self, node):
+        o = node * 6
+        b = self.node_bounds
+        return (b[o], b[o + 1], b[o + 2]), (b[o + 3], b[o + 4], b[o + 5])
+
+    def _prim_box(self, prim):
+        o = self.prim_offset[prim]
+        d = self.prim_data
+        return ((min(d[o], d[o + 3]), min(d[o + 1], d[o + 4]), min(d[o + 2], d[o + 5])),
+                (max(d[o], d[o + 3]), max(d[o + 1], d[o + 4]), max(d[o + 2], d[o + 5])))
+
+    def _hit(self, distance, point, prim):
+        return BVHHit(distance, point, self._prim_kind(prim), self.prim_model[prim], self.prim_index[prim])
+
+    def _ray_prim(self, origin, direction, inv_dir, prim):
+        kind = self._prim_kind(prim)
+        if kind == PRIM_FACE:
+            return _ray_triangle(origin, direction, *self._face(prim))
+        o = self.prim_offset[prim]
+        d = self.prim_data
+        if kind == PRIM_SPHERE:
+            return _ray_sphere(origin, direction, (d[o], d[o + 1], d[o + 2]), d[o + 3])
+        bmin, bmax = self._prim_box(prim)
+        return _ray_aabb(origin, inv_dir, bmin, bmax, _INF)
+
+    def _closest_on_prim(self, point, prim):
+        kind = self._prim_kind(prim)
+        if kind == PRIM_FACE:
+            return _closest_on_triangle(point, *self._face(prim))
+        o = self.prim_offset[prim]
+        d = self.prim_data
+        if kind == PRIM_SPHERE:
+            center = (d[o], d[o + 1], d[o + 2])
+            offset = _sub(point, center)
+            length = sqrt(_dot(offset, offset))
+            if length < _EPSILON:
+                return (center[0], center[1], center[2] + d[o + 3])
+            s = d[o + 3] / length
+            return (center[0] + offset[0] * s, center[1] + offset[1] * s, center[2] + offset[2] * s)
+        bmin, bmax = self._prim_box(prim)
+        return tuple(min(max(point[i], bmin[i]), bmax[i]) for i in range(3))
+
+    def _prim_overlaps(self, prim, bmin, bmax):
+        kind = self._prim_kind(prim)
+        if kind == PRIM_FACE:
+            return _triangle_aabb_overlap(*(self._face(prim) + (bmin, bmax)))
+        if kind == PRIM_SPHERE:
+            o = self.prim_offset[prim]
+            d = self.prim_data
+            return _aabb_dist2((d[o], d[o + 1], d[o + 2]), bmin, bmax) <= d[o + 3] * d[o + 3]
+        return True  # box bounds are exact
+
+    # queries --------------------------------------------------------------
+
+    def ray_cast(self, origin, direction, max_distance=_INF):
+        """Nearest hit along the ray, distances are in units of direction's length"""
+        if not self.node_left:
+            return None
+        inv_dir = tuple(1.0 / v if v != 0.0 else _INF for v in direction)
+        best_t = max_distance
+        best_prim = -1
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            bmin, bmax = self._node_bounds(node)
+            if _ray_aabb(origin, inv_dir, bmin, bmax, best_t) is None:
+                continue
+            count = self.node_count[node]
+            if count:
+                start = self.node_start[node]
+                for prim in self.prim_order[start:start + count]:
+                    t = self._ray_prim(origin, direction, inv_dir, prim)
+                    if t is not None and t < best_t:
+                        best_t = t
+                        best_prim = prim
+            else:
+                stack.append(self.node_right[node])
+                stack.append(self.node_left[node])
+
+        if best_prim < 0:
+            return None
+        point = tuple(origin[i] + direction[i] * best_t for i in range(3))
+        return self._hit(best_t, point, best_prim)
+
+    def ray_cast_many(self, origins, directions, max_distance=_INF):
+        return [self.ray_cast(o, d, max_distance) for o, d in zip(origins, directions)]
+
+    def overlap_aabb(self, bmin, bmax):
+        """All primitives intersecting the box, as (kind, model, index) tuples"""
+        result = []
+        if not self.node_left:
+            return result
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            nmin, nmax = self._node_bounds(node)
+            if any(nmin[i] > bmax[i] or nmax[i] < bmin[i] for i in range(3)):
+                continue
+            count = self.node_count[node]
+            if count:
+                start = self.node_start[node]
+                pb = self.prim_bounds
+                for prim in self.prim_order[start:start + count]:
+                    o = prim * 6
+                    if any(pb[o + i] > bmax[i] or pb[o + 3 + i] < bmin[i] for i in range(3)):
+                        continue
+                    if self._prim_overlaps(prim, bmin, bmax):
+                        result.append((self._prim_kind(prim), self.prim_model[prim], self.prim_index[prim]))
+            else:
+                stack.append(self.node_right[node])
+                stack.append(self.node_left[node])
+        return result
+
+    def overlap_aabb_many(self, boxes):
+        return [self.overlap_aabb(bmin, bmax) for bmin, bmax in boxes]
+
+    def closest_point(self, point, max_distance=_INF):
+        """Nearest surface point; spheres and boxes are treated as their surfaces"""
+        if not self.node_left:
+            return None
+        best_d2 = max_distance * max_distance if max_distance != _INF else _INF
+        best = None
+        best_prim = -1
+        stack = [(0.0, 0)]
+        while stack:
+            node_d2, node = stack.pop()
+            if node_d2 > best_d2:
+                continue
+            count = self.node_count[node]
+            if count:
+                start = self.node_start[node]
+                for prim in self.prim_order[start:start + count]:
+                    p = self._closest_on_prim(point, prim)
+                    d2 = _dist2(p, point)
+                    if d2 < best_d2:
+                        best_d2 = d2
+                        best = p
+                        best_prim = prim
+            else:
+                children = []
+                for child in (self.node_left[node], self.node_right[node]):
+                    d2 = _aabb_dist2(point, *self._node_bounds(child))
+                    if d2 <= best_d2:
+                        children.append((d2, child))
+                # Visit the nearer child first
+                children.sort(reverse=True)
+                stack.extend(children)
+
+        if best_prim < 0:
+            return None
+        return self._hit(sqrt(best_d2), best, best_prim)
+
+    def closest_point_many(self, points, max_distance=_INF):
+        return [self.closest_point(p, max_distance) for p in points]
+
+    def ground_height(self, x, y, z_start=1000.0, z_end=-1000.0):
+        """Height of the first surface below (x, y, z_start), None if nothing is hit"""
+        hit = self.ray_cast((x, y, z_start), (0.0, 0.0, -1.0), z_start - z_end)
+        return None if hit is None else hit.point[2]
+
+    # serialisation --------------------------------------------------------
+
+    __arrays = ["prim_model", "prim_index", "prim_data", "prim_offset", "prim_bounds",
+                "node_bounds", "node_left", "node_right", "node_start", "node_count", "prim_order"]
+
+    def to_bytes(self):
+        data = pack(_HEADER, _MAGIC, _FILE_VERSION, self.leaf_size,
+                    self.face_count, self.sphere_count, self.box_count,
+                    len(self.prim_data), len(self.node_left))
+        for name in ColBVH.__arrays:
+            arr = getattr(self, name)
+            if sys.byteorder != "little":
+                arr = array(arr.typecode, arr)
+                arr.byteswap()
+            data += arr.tobytes()
+        return data
+
+    @classmethod
+    def from_bytes(cls, data):
+        (magic, version, leaf_size, face_count, sphere_count,
+         box_count, data_len, node_count) = unpack_from(_HEADER, data, 0)
+        if magic != _MAGIC or version != _FILE_VERSION:
+            raise RuntimeError("Invalid BVH data")
+
+        bvh = cls(leaf_size)
+        bvh.face_count = face_count
+        bvh.sphere_count = sphere_count
+        bvh.box_count = box_count
+        prims = face_count + sphere_count + box_count
+        lengths = {
+            "prim_model": prims, "prim_index": prims, "prim_data": data_len,
+            "prim_offset": prims, "prim_bounds": prims * 6, "node_bounds": node_count * 6,
+            "node_left": node_count, "node_right": node_count, "node_start": node_count,
+            "node_count": node_count, "prim_order": prims,
+        }
+
+        pos = calcsize(_HEADER)
+        for name in ColBVH.__arrays:
+            arr = array(getattr(bvh, name).typecode)
+            size = lengths[name] * arr.itemsize
+            arr.frombytes(data[pos:pos + size])
+            if sys.byteorder != "little":
+                arr.byteswap()
+            pos += size
+            setattr(bvh, name, arr)
+        return bvh
+
+    def save(self, fname):
+        with open(fname, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, fname):
+        with open(fname, "rb") as f:
+            return cls.from_bytes(f.read())
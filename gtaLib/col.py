@@ -1,9 +1,11 @@
 # col.py — DragonFF COL (collision) format handler, Blender 2.79 port
 # GPLv3 © Parik 2019, modified for 2.79 compatibility
 
+import copy
 from struct import unpack_from, calcsize, pack
 from struct import error as StructError
 from collections import namedtuple
+from math import sqrt
 
 try:
     from .dff import strlen
@@ -203,6 +205,12 @@ class coll:
         self._pos = pos + box_offset + 4
         model.boxes += self.__read_block(TBox, box_count)
 
+        # Face groups, stored right before the faces and followed by their count
+        if flags & 8:
+            group_count = unpack_from("<I", self._data, pos + faces_offset)[0]
+            self._pos = pos + faces_offset - group_count * Sections.size(TFaceGroup)
+            model.face_groups += self.__read_block(TFaceGroup, group_count)
+
         # Faces
         self._pos = pos + faces_offset + 4
         model.mesh_faces += self.__read_block(TFace, face_count)
@@ -273,6 +281,80 @@ class coll:
         with open(fname, "rb") as f:
             self.load_memory(f.read())
 
+    @staticmethod
+    def iter_models(source):
+        """Yield models one at a time from a file name or a buffer such as an mmap.
+
+        Only a single model's bytes are held in memory at any time.
+        """
+        reader = coll()
+
+        def models(read):
+            while True:
+                header = read(8)
+                if len(header) < 8 or header[:3] != b"COL":
+                    return
+                size = unpack_from("<I", header, 4)[0]
+                body = read(size)
+                if len(body) < size:
+                    return
+                reader._data = header + body
+                reader._pos = 0
+                try:
+                    yield reader.__read_col()
+                except RuntimeError:
+                    return
+
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                for model in models(f.read):
+                    yield model
+            return
+
+        view = memoryview(source)
+        state = {"pos": 0}
+
+        def read(n):
+            pos = state["pos"]
+            state["pos"] = pos + n
+            return bytes(view[pos:pos + n])
+
+        for model in models(read):
+            yield model
+
+    @staticmethod
+    def iter_model_names(source):
+        """Yield the model name of each model in a file name or a buffer, reading only the headers"""
+
+        def names(read, skip):
+            while True:
+                header = read(32)
+                if len(header) < 32 or header[:3] != b"COL":
+                    return
+                size = unpack_from("<I", header, 4)[0]
+                yield header[8:30].split(b"\x00", 1)[0].decode("ascii", errors="ignore")
+                skip(size - 24)
+
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                for name in names(f.read, lambda n: f.seek(n, 1)):
+                    yield name
+            return
+
+        view = memoryview(source)
+        state = {"pos": 0}
+
+        def read(n):
+            pos = state["pos"]
+            state["pos"] = pos + n
+            return bytes(view[pos:pos + n])
+
+        def skip(n):
+            state["pos"] += n
+
+        for name in names(read, skip):
+            yield name
+
     # write ---------------------------------------------------------------
 
     def __write_block(self, block_type, blocks, write_count=True):
@@ -292,8 +374,82 @@ class coll:
         d += self.__write_block(TFace, model.mesh_faces)
         return d
 
-    def __write_col(self, model):
+    def __write_col_new(self, model):
+        flags = 0
+        if model.mesh_faces or model.spheres or model.boxes:
+            flags |= 2
+        if model.face_groups:
+            flags |= 8
+        if model.version >= 3 and model.shadow_faces:
+            flags |= 16
+
+        # Offsets are relative to the size field of the model header
+        header_len = 104
+        if model.version >= 3:
+            header_len += 12
+        if model.version == 4:
+            header_len += 4
+
+        def align(block):
+            return block + b"\0" * (-len(block) % 4)
+
+        spheres_data = self.__write_block(TSphere, model.spheres, False)
+        boxes_data = self.__write_block(TBox, model.boxes, False)
+        verts_data = align(self.__write_block(
+            TVertex, Sections.compress_vertices(model.mesh_verts), False))
+
+        face_groups_data = b""
+        if model.face_groups:
+            face_groups_data = self.__write_block(TFaceGroup, model.face_groups, False)
+            face_groups_data += pack("<I", len(model.face_groups))
+        faces_data = align(self.__write_block(TFace, model.mesh_faces, False))
+
+        spheres_offset = header_len
+        box_offset = spheres_offset + len(spheres_data)
+        verts_offset = box_offset + len(boxes_data)
+        faces_offset = verts_offset + len(verts_data) + len(face_groups_data)
+        end_offset = faces_offset + len(faces_data)
+
+        data = pack(
+            "<HHHBxIIIIIII",
+            len(model.spheres),
+            len(model.boxes),
+            len(model.mesh_faces),
+            0,
+            flags,
+            spheres_offset,
+            box_offset,
+            0,
+            verts_offset,
+            faces_offset,
+            0,
+        )
+
+        shadow_data = b""
+        if model.version >= 3:
+            shadow_verts_offset = shadow_faces_offset = 0
+            if flags & 16:
+                shadow_verts_data = self.__write_block(
+                    TVertex, Sections.compress_vertices(model.shadow_verts), False)
+                shadow_verts_offset = end_offset
+                shadow_faces_offset = shadow_verts_offset + len(shadow_verts_data)
+                shadow_data = shadow_verts_data + self.__write_block(TFace, model.shadow_faces, False)
+            data += pack("<III", len(model.shadow_faces), shadow_verts_offset, shadow_faces_offset)
+        if model.version == 4:
+            data += pack("<I", 0)
+
+        return (data + spheres_data + boxes_data + verts_data + face_groups_data
+                + faces_data + shadow_data)
+
+    def __write_col(self, model, update_bounds=False, face_groups=False):
+        if face_groups:
+            # Faces are reordered for the groups, leave the caller's model as is.
+            # COL1 and meshes below build_face_groups' min_faces get no groups
+            model = copy.copy(model)
+            build_face_groups(model)
         Sections.init_sections(model.version)
+        if update_bounds or model.bounds is None:
+            model.bounds = compute_bounds(model)
         data = (
             self.__write_col_legacy(model)
             if model.version == 1
@@ -309,10 +465,281 @@ class coll:
         ]
         return pack("4sI22sH", *header) + data
 
-    def write_memory(self):
-        return b"".join(self.__write_col(m) for m in self.models)
+    def write_memory(self, update_bounds=False, face_groups=False):
+        """face_groups generates face groups for COL2+ meshes large enough for the game to use them"""
+        return b"".join(self.__write_col(m, update_bounds, face_groups) for m in self.models)
 
-    def write_file(self, fname):
+    def write_file(self, fname, update_bounds=False, face_groups=False):
         with open(fname, "wb") as f:
-            f.write(self.write_memory())
+            f.write(self.write_memory(update_bounds, face_groups))
+
+    @staticmethod
+    def write_stream(fname, models, update_bounds=False, face_groups=False):
+        """Write models from any iterable, e.g. coll.iter_models, one at a time"""
+        writer = coll()
+        count = 0
+        with open(fname, "wb") as f:
+            for model in models:
+                f.write(writer.__write_col(model, update_bounds, face_groups))
+                count += 1
+        return count
+
+    @staticmethod
+    def convert_version(model, version):
+        """Rebuild a model's records in the layout of another COL version"""
+        if model.version == version:
+            return model
+
+        old_version = model.version
+        Sections.init_sections(version)
+        model.bounds = TBounds(**model.bounds._asdict()) if model.bounds is not None else None
+        model.spheres = [TSphere(**s._asdict()) for s in model.spheres]
+        model.boxes = [TBox(**b._asdict()) for b in model.boxes]
+
+        def convert_faces(faces):
+            if old_version == 1 and version > 1:
+                return [TFace(f.a, f.b, f.c, f.surface.material, f.surface.light) for f in faces]
+            if old_version > 1 and version == 1:
+                return [TFace(f.a, f.b, f.c, TSurface(f.material, 0, 0, f.light)) for f in faces]
+            return [TFace(*f) for f in faces]
+
+        model.mesh_faces = convert_faces(model.mesh_faces)
+        model.mesh_verts = [tuple(v) for v in model.mesh_verts]
+        if version >= 3:
+            model.shadow_faces = convert_faces(model.shadow_faces)
+        else:
+            model.shadow_verts = []
+            model.shadow_faces = []
+        if version == 1:
+            model.face_groups = []
+        else:
+            model.face_groups = [TFaceGroup(*g) for g in model.face_groups]
 
+        model.version = version
+        return model
+
+
+
+# -------------------------------------------------------------------------
+# Bounds
+
+def _sphere_from(points):
+    """Smallest sphere through up to four points, None if they are degenerate"""
+    if len(points) == 1:
+        return points[0], 0.0
+
+    a = points[0]
+    rows = [[p[i] - a[i] for i in range(3)] for p in points[1:]]
+    if len(rows) == 1:
+        center = [a[i] + rows[0][i] * 0.5 for i in range(3)]
+        return center, sqrt(sum(d * d for d in rows[0])) * 0.5
+
+    if len(rows) == 2:
+        # Circumcircle in the plane of the triangle
+        u, v = rows
+        uu = sum(x * x for x in u)
+        vv = sum(x * x for x in v)
+        uv = sum(u[i] * v[i] for i in range(3))
+        det = 2.0 * (uu * vv - uv * uv)
+        if abs(det) < 1e-12:
+            return None
+        s = (uu * vv - vv * uv) / det
+        t = (vv * uu - uu * uv) / det
+        offset = [u[i] * s + v[i] * t for i in range(3)]
+    else:
+        # Circumsphere of the tetrahedron, solve 2 * rows * x = |rows|^2
+        m = [[2.0 * r[i] for i in range(3)] for r in rows]
+        rhs = [sum(x * x for x in r) for r in rows]
+        det = (m[0][0] * (m[1][1] * m[2][2] - m[1][2] * m[2][1])
+               - m[0][1] * (m[1][0] * m[2][2] - m[1][2] * m[2][0])
+               + m[0][2] * (m[1][0] * m[2][1] - m[1][1] * m[2][0]))
+        if abs(det) < 1e-12:
+            return None
+        offset = []
+        for col_idx in range(3):
+            mc = [list(row) for row in m]
+            for row_idx in range(3):
+                mc[row_idx][col_idx] = rhs[row_idx]
+            offset.append((mc[0][0] * (mc[1][1] * mc[2][2] - mc[1][2] * mc[2][1])
+                           - mc[0][1] * (mc[1][0] * mc[2][2] - mc[1][2] * mc[2][0])
+                           + mc[0][2] * (mc[1][0] * mc[2][1] - mc[1][1] * mc[2][0])) / det)
+
+    center = [a[i] + offset[i] for i in range(3)]
+    return center, sqrt(sum(d * d for d in offset))
+
+
+def _enclosing_sphere(points):
+    """Minimal enclosing sphere of a point set (iterative Welzl)"""
+    import random
+
+    points = list(set(tuple(p) for p in points))
+    random.Random(0).shuffle(points)
+    eps = 1e-6
+
+    def outside(sphere, p):
+        center, radius = sphere
+        return sum((p[i] - center[i]) ** 2 for i in range(3)) > (radius + eps) ** 2
+
+    def fit(support, fallback, p):
+        sphere = _sphere_from(support)
+        if sphere is None:
+            # Coplanar or collinear support, grow the current sphere instead
+            center, radius = fallback
+            radius = sqrt(sum((p[i] - center[i]) ** 2 for i in range(3)))
+            return center, radius
+        return sphere
+
+    sphere = (points[0], 0.0)
+    for i in range(1, len(points)):
+        if not outside(sphere, points[i]):
+            continue
+        sphere = (points[i], 0.0)
+        for j in range(i):
+            if not outside(sphere, points[j]):
+                continue
+            sphere = fit([points[i], points[j]], sphere, points[j])
+            for k in range(j):
+                if not outside(sphere, points[k]):
+                    continue
+                sphere = fit([points[i], points[j], points[k]], sphere, points[k])
+                for l in range(k):
+                    if outside(sphere, points[l]):
+                        sphere = fit([points[i], points[j], points[k], points[l]], sphere, points[l])
+    return sphere
+
+
+def compute_bounds(model):
+    """Bounding box, centre and enclosing sphere over vertices, spheres and boxes.
+
+    The sphere is the minimal one around the vertices, box corners and sphere
+    centres, grown to contain the collision spheres. The result uses the
+    TBounds field order of the model's version.
+    """
+    points = [tuple(v) for v in model.mesh_verts]
+    for b in model.boxes:
+        points += [(x, y, z) for x in (b.min[0], b.max[0])
+                   for y in (b.min[1], b.max[1]) for z in (b.min[2], b.max[2])]
+    points += [tuple(s.center) for s in model.spheres]
+
+    Sections.init_sections(model.version)
+    if not points:
+        zero = (0.0, 0.0, 0.0)
+        return TBounds(radius=0.0, center=zero, min=zero, max=zero)
+
+    lo = [min(p[i] for p in points) for i in range(3)]
+    hi = [max(p[i] for p in points) for i in range(3)]
+    for s in model.spheres:
+        for i in range(3):
+            lo[i] = min(lo[i], s.center[i] - s.radius)
+            hi[i] = max(hi[i], s.center[i] + s.radius)
+
+    center, radius = _enclosing_sphere(points)
+    for s in model.spheres:
+        dist = sqrt(sum((s.center[i] - center[i]) ** 2 for i in range(3)))
+        radius = max(radius, dist + s.radius)
+
+    return TBounds(radius=radius, center=tuple(center), min=tuple(lo), max=tuple(hi))
+
+
+# -------------------------------------------------------------------------
+# Face groups
+
+def _morton_code(x, y, z):
+    """Interleave three 10 bit integers"""
+    code = 0
+    for bit in range(10):
+        code |= (((x >> bit) & 1) << (3 * bit + 2)) | \
+                (((y >> bit) & 1) << (3 * bit + 1)) | \
+                ((z >> bit) & 1) << (3 * bit)
+    return code
+
+
+def build_face_groups(model, max_faces=32, min_faces=80):
+    """Sort the faces of a COL2+ model in Morton order and split them into face groups.
+
+    The game only walks face groups for meshes with more than min_faces faces,
+    smaller meshes are left untouched. Faces are reordered in place.
+    """
+    faces = model.mesh_faces
+    verts = model.mesh_verts
+    if model.version == 1 or len(faces) <= min_faces:
+        model.face_groups = []
+        return model.face_groups
+
+    Sections.init_sections(model.version)
+    centroids = [
+        [(verts[f.a][i] + verts[f.b][i] + verts[f.c][i]) / 3.0 for i in range(3)]
+        for f in faces
+    ]
+    lo = [min(c[i] for c in centroids) for i in range(3)]
+    hi = [max(c[i] for c in centroids) for i in range(3)]
+    scale = [1023.0 / (hi[i] - lo[i]) if hi[i] > lo[i] else 0.0 for i in range(3)]
+
+    codes = [
+        _morton_code(*[int((c[i] - lo[i]) * scale[i]) for i in range(3)])
+        for c in centroids
+    ]
+    order = sorted(range(len(faces)), key=codes.__getitem__)
+    model.mesh_faces = [faces[i] for i in order]
+
+    groups = []
+    for start in range(0, len(order), max_faces):
+        end = min(start + max_faces, len(order)) - 1
+        points = [verts[idx] for f in model.mesh_faces[start:end + 1] for idx in (f.a, f.b, f.c)]
+        groups.append(TFaceGroup(
+            tuple(min(p[i] for p in points) for i in range(3)),
+            tuple(max(p[i] for p in points) for i in range(3)),
+            start,
+            end,
+        ))
+
+    model.face_groups = groups
+    return groups
+
+
+def face_group_query_cost(model, boxes):
+    """Average number of triangles tested per box query, without and with face groups"""
+    if not boxes:
+        return 0.0, 0.0
+
+    tested = 0
+    for bmin, bmax in boxes:
+        if not model.face_groups:
+            tested += len(model.mesh_faces)
+            continue
+        for group in model.face_groups:
+            if all(group.min[i] <= bmax[i] and group.max[i] >= bmin[i] for i in range(3)):
+                tested += group.end - group.start + 1
+
+    return float(len(model.mesh_faces)), tested / float(len(boxes))
+
+
+def benchmark_face_groups(model, query_count=1000, query_size=2.0, max_faces=32, seed=0):
+    """Compare triangles tested per query for random boxes inside the model bounds"""
+    import random
+
+    rng = random.Random(seed)
+    verts = model.mesh_verts
+    if not verts:
+        return {"faces": 0, "groups": 0, "without_groups": 0.0, "with_groups": 0.0}
+    lo = [min(v[i] for v in verts) for i in range(3)]
+    hi = [max(v[i] for v in verts) for i in range(3)]
+
+    boxes = []
+    for _ in range(query_count):
+        center = [rng.uniform(lo[i], hi[i]) for i in range(3)]
+        boxes.append((
+            tuple(c - query_size * 0.5 for c in center),
+            tuple(c + query_size * 0.5 for c in center),
+        ))
+
+    # build_face_groups reorders faces and replaces groups, keep the caller's model as is
+    model = copy.copy(model)
+    build_face_groups(model, max_faces, min_faces=0)
+    without_groups, with_groups = face_group_query_cost(model, boxes)
+    return {
+        "faces": len(model.mesh_faces),
+        "groups": len(model.face_groups),
+        "without_groups": without_groups,
+        "with_groups": with_groups,
+    }
@@ -0,0 +1,258 @@
+# colmesh.py — DragonFF COL mesh preprocessing, Blender 2.79 port
+# Vertex welding, degenerate face removal and quadric decimation for ColModel meshes
+
+import heapq
+from math import sqrt
+
+# Vertices are stored as int16 multiples of 1/128 in COL2+ (see Sections.compress_vertices)
+QUANTISATION = 128
+
+
+# -------------------------------------------------------------------------
+def _face_material(face):
+    material = getattr(face, "material", None)
+    if material is None:
+        material = face.surface.material
+    return material
+
+
+def _normal(a, b, c):
+    e1 = (b[0] - a[0], b[1] - a[1], b[2] - a[2])
+    e2 = (c[0] - a[0], c[1] - a[1], c[2] - a[2])
+    return (e1[1] * e2[2] - e1[2] * e2[1],
+            e1[2] * e2[0] - e1[0] * e2[2],
+            e1[0] * e2[1] - e1[1] * e2[0])
+
+
+def _remap_faces(faces, remap):
+    return [f._replace(a=remap[f.a], b=remap[f.b], c=remap[f.c]) for f in faces]
+
+
+def _compact(verts, faces):
+    """Drop vertices no face references"""
+    remap = {}
+    new_verts = []
+    for f in faces:
+        for idx in (f.a, f.b, f.c):
+            if idx not in remap:
+                remap[idx] = len(new_verts)
+                new_verts.append(verts[idx])
+    return new_verts, _remap_faces(faces, remap)
+
+
+# -------------------------------------------------------------------------
+def weld_vertices(verts, faces, quantisation=QUANTISATION):
+    """Merge vertices that fall into the same quantisation cell"""
+    cells = {}
+    remap = []
+    new_verts = []
+    for v in verts:
+        key = (int(v[0] * quantisation), int(v[1] * quantisation), int(v[2] * quantisation))
+        idx = cells.get(key)
+        if idx is None:
+            idx = cells[key] = len(new_verts)
+            new_verts.append(v)
+        remap.append(idx)
+    return new_verts, _remap_faces(faces, remap)
+
+
+def remove_degenerate_faces(verts, faces, min_area=1e-6):
+    """Drop faces with repeated indices, zero area, or duplicating another face"""
+    seen = set()
+    result = []
+    for f in faces:
+        if f.a == f.b or f.b == f.c or f.a == f.c:
+            continue
+        n = _normal(verts[f.a], verts[f.b], verts[f.c])
+        if n[0] * n[0] + n[1] * n[1] + n[2] * n[2] <= (2.0 * min_area) ** 2:
+            continue
+        key = tuple(sorted((f.a, f.b, f.c)))
+        if key in seen:
+            continue
+        seen.add(key)
+        result.append(f)
+    return result
+
+
+# -------------------------------------------------------------------------
+def _plane_quadric(a, b, c):
+    n = _normal(a, b, c)
+    length = sqrt(n[0] * n[0] + n[1] * n[1] + n[2] * n[2])
+    if length == 0.0:
+        return [0.0] * 10
+    x, y, z = n[0] / length, n[1] / length, n[2] / length
+    d = -(x * a[0] + y * a[1] + z * a[2])
+    # Upper triangle of the symmetric 4x4 matrix pp^T
+    return [x * x, x * y, x * z, x * d,
+            y * y, y * z, y * d,
+            z * z, z * d,
+            d * d]
+
+
+def _quadric_error(q, v):
+    x, y, z = v
+    return (q[0] * x * x + 2 * q[1] * x * y + 2 * q[2] * x * z + 2 * q[3] * x
+            + q[4] * y * y + 2 * q[5] * y * z + 2 * q[6] * y
+            + q[7] * z * z + 2 * q[8] * z
+            + q[9])
+
+
+def decimate(verts, faces, target_faces):
+    """Quadric error edge collapse down to target_faces.
+
+    Vertices on open edges or on edges between faces of different surface
+    materials are locked, so material boundaries and outlines stay intact.
+    """
+    if len(faces) <= target_faces:
+        return list(verts), list(faces)
+
+    positions = [tuple(v) for v in verts]
+    tris = [[f.a, f.b, f.c] for f in faces]
+    alive_faces = [True] * len(tris)
+    face_count = len(tris)
+
+    quadrics = [[0.0] * 10 for _ in positions]
+    vertex_faces = [set() for _ in positions]
+    edge_faces = {}
+    for fi, (a, b, c) in enumerate(tris):
+        q = _plane_quadric(positions[a], positions[b], positions[c])
+        for idx in (a, b, c):
+            vq = quadrics[idx]
+            for i in range(10):
+                vq[i] += q[i]
+            vertex_faces[idx].add(fi)
+        for e in ((a, b), (b, c), (c, a)):
+            edge_faces.setdefault((min(e), max(e)), []).append(fi)
+
+    locked = [False] * len(positions)
+    for (a, b), fis in edge_faces.items():
+        if len(fis) != 2 or _face_material(faces[fis[0]]) != _face_material(faces[fis[1]]):
+            locked[a] = locked[b] = True
+
+    version = [0] * len(positions)
+    alive = [True] * len(positions)
+    heap = []
+
+    def candidate(u, v):
+        if locked[u] and locked[v]:
+            return None
+        q = [quadrics[u][i] + quadrics[v][i] for i in range(10)]
+        if locked[u]:
+            options = [positions[u]]
+        elif locked[v]:
+            options = [positions[v]]
+        else:
+            pu, pv = positions[u], positions[v]
+            options = [pu, pv, tuple((pu[i] + pv[i]) * 0.5 for i in range(3))]
+        cost, pos = min((_quadric_error(q, p), p) for p in options)
+        return cost, pos
+
+    def push(u, v):
+        result = candidate(u, v)
+        if result is not None:
+            heapq.heappush(heap, (result[0], u, v, version[u], version[v], result[1]))
+
+    for a, b in edge_faces:
+        push(a, b)
+
+    def flips(vertex, other, pos):
+        for fi in vertex_faces[vertex]:
+            tri = tris[fi]
+            if other in tri:
+                continue
+            old = _normal(*[positions[i] for i in tri])
+            new = _normal(*[pos if i == vertex else positions[i] for i in tri])
+            if old[0] * new[0] + old[1] * new[1] + old[2] * new[2] <= 0.0:
+                return True
+        return False
+
+    while face_count > target_faces and heap:
+        _, u, v, ver_u, ver_v, pos = heapq.heappop(heap)
+        if not (alive[u] and alive[v]) or version[u] != ver_u or version[v] != ver_v:
+            continue
+        if flips(u, v, pos) or flips(v, u, pos):
+            continue
+
+        # Collapse u into v
+        positions[v] = pos
+        quadrics[v] = [quadrics[u][i] + quadrics[v][i] for i in range(10)]
+        locked[v] = locked[u] or locked[v]
+        for fi in vertex_faces[u]:
+            tri = tris[fi]
+            if v in tri:
+                alive_faces[fi] = False
+                face_count -= 1
+                for idx in tri:
+                    if idx != u:
+                        vertex_faces[idx].discard(fi)
+            else:
+                tri[tri.index(u)] = v
+                vertex_faces[v].add(fi)
+        vertex_faces[u] = set()
+        alive[u] = False
+        version[v] += 1
+
+        neighbours = set()
+        for fi in vertex_faces[v]:
+            neighbours.update(tris[fi])
+        neighbours.discard(v)
+        for n in neighbours:
+            version[n] += 1
+        for n in neighbours:
+            push(min(n, v), max(n, v))
+            for fi in vertex_faces[n]:
+                for m in tris[fi]:
+                    if m != n and m != v:
+                        push(min(n, m), max(n, m))
+
+    new_faces = [
+        faces[fi]._replace(a=tri[0], b=tri[1], c=tri[2])
+        for fi, tri in enumerate(tris) if alive_faces[fi]
+    ]
+    return _compact(positions, new_faces)
+
+
+# -------------------------------------------------------------------------
+def optimise_mesh(verts, faces, target_faces=None, quantisation=QUANTISATION):
+    """Weld, clean and optionally decimate a collision mesh, returns (verts, faces, report)"""
+    report = {"verts_before": len(verts), "faces_before": len(faces)}
+
+    verts, faces = weld_vertices(verts, faces, quantisation)
+    report["welded_verts"] = report["verts_before"] - len(verts)
+
+    min_area = 0.5 / (quantisation * quantisation)
+    count = len(faces)
+    faces = remove_degenerate_faces(verts, faces, min_area)
+    report["degenerate_faces"] = count - len(faces)
+
+    count = len(faces)
+    if target_faces is not None:
+        verts, faces = decimate(verts, faces, target_faces)
+        verts, faces = _compact(verts, remove_degenerate_faces(verts, faces, min_area))
+    else:
+        verts, faces = _compact(verts, faces)
+    report["decimated_faces"] = count - len(faces)
+
+    report["verts_after"] = len(verts)
+    report["faces_after"] = len(faces)
+    report["reduction"] = (
+        1.0 - len(faces) / float(report["faces_before"]) if report["faces_before"] else 0.0
+    )
+    return verts, faces, report
+
+
+def optimise_model(model, target_faces=None, shadow_target_faces=None):
+    """Run optimise_mesh over the collision and shadow meshes of a ColModel in place"""
+    model.mesh_verts, model.mesh_faces, report = optimise_mesh(
+        model.mesh_verts, model.mesh_faces, target_faces)
+    if model.shadow_faces:
+        model.shadow_verts, model.shadow_faces, shadow_report = optimise_mesh(
+            model.shadow_verts, model.shadow_faces, shadow_target_faces)
+        report["shadow"] = shadow_report
+
+    # Existing face groups index the old face order
+    model.face_groups = []
+
+    print("%s: %d -> %d faces (%.1f%% fewer)" % (
+        model.model_name, report["faces_before"], report["faces_after"], report["reduction"] * 100.0))
+    return report
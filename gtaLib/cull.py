@@ -0,0 +1,167 @@
+# GTA DragonFF cull zone utility (2.79 compatible)
+# Python 3.5 safe: no dataclasses, no f-strings
+from __future__ import absolute_import, print_function
+
+from collections import namedtuple
+from math import floor
+
+# Oriented box over the XY plane with a vertical extent
+#
+# center is (x, y, z), axis_u and axis_v are (x, y) half vectors spanning a
+# parallelogram (a rectangle for all shipped zones) and bottom <= z <= top.
+CullZone = namedtuple("CullZone", "center axis_u axis_v bottom top flag unknown")
+
+#######################################################
+def cull_zone_from_entry(entry):
+    values = [float(v) for v in entry[:9]]
+    flag = int(float(entry[9])) if len(entry) > 9 else 0
+    unknown = int(float(entry[10])) if len(entry) > 10 else 0
+    center = (values[0], values[1], values[2])
+
+    if "lowerLeftX" in getattr(entry, "_fields", ()):
+        # III / VC: center followed by the lower left and upper right corners
+        min_x, min_y, min_z, max_x, max_y, max_z = values[3:9]
+        return CullZone(((min_x + max_x) * 0.5, (min_y + max_y) * 0.5, center[2]),
+                        ((max_x - min_x) * 0.5, 0.0), (0.0, (max_y - min_y) * 0.5),
+                        min_z, max_z, flag, unknown)
+
+    # SA: center, first half vector, bottom, second half vector, top
+    return CullZone(center, (values[3], values[4]), (values[6], values[7]),
+                    values[5], values[8], flag, unknown)
+
+#######################################################
+def cull_zone_line(zone, box_layout=False):
+    cx, cy, cz = zone.center
+    if box_layout:
+        min_x, min_y, max_x, max_y = cull_zone_bounds(zone)
+        values = (cx, cy, cz, min_x, min_y, zone.bottom, max_x, max_y, zone.top)
+    else:
+        (ux, uy), (vx, vy) = zone.axis_u, zone.axis_v
+        values = (cx, cy, cz, ux, uy, zone.bottom, vx, vy, zone.top)
+    return ", ".join(["%g" % v for v in values] + [str(zone.flag), str(zone.unknown)])
+
+#######################################################
+def cull_zone_bounds(zone):
+    (ux, uy), (vx, vy) = zone.axis_u, zone.axis_v
+    ex = abs(ux) + abs(vx)
+    ey = abs(uy) + abs(vy)
+    return zone.center[0] - ex, zone.center[1] - ey, zone.center[0] + ex, zone.center[1] + ey
+
+#######################################################
+def cull_zone_contains(zone, x, y, z):
+    if z < zone.bottom or z > zone.top:
+        return False
+    (ux, uy), (vx, vy) = zone.axis_u, zone.axis_v
+    det = ux * vy - uy * vx
+    if det == 0.0:
+        return False
+    # Solve p - center = s * u + t * v, inside when |s| <= 1 and |t| <= 1
+    dx = x - zone.center[0]
+    dy = y - zone.center[1]
+    limit = abs(det)
+    return abs(dx * vy - dy * vx) <= limit and abs(ux * dy - uy * dx) <= limit
+
+#######################################################
+def cull_zone_overlaps_box(zone, box_min, box_max):
+    if box_max[2] < zone.bottom or box_min[2] > zone.top:
+        return False
+
+    # Separating axis test in the XY plane: box axes first, then zone axes
+    min_x, min_y, max_x, max_y = cull_zone_bounds(zone)
+    if max_x < box_min[0] or min_x > box_max[0] or max_y < box_min[1] or min_y > box_max[1]:
+        return False
+
+    hx = (box_max[0] - box_min[0]) * 0.5
+    hy = (box_max[1] - box_min[1]) * 0.5
+    dx = (box_min[0] + box_max[0]) * 0.5 - zone.center[0]
+    dy = (box_min[1] + box_max[1]) * 0.5 - zone.center[1]
+    for (ax, ay), (bx, by) in ((zone.axis_u, zone.axis_v), (zone.axis_v, zone.axis_u)):
+        # Edge normal perpendicular to b, the zone reaches |a.n| along it
+        nx, ny = -by, bx
+        reach = abs(ax * nx + ay * ny) + hx * abs(nx) + hy * abs(ny)
+        if abs(dx * nx + dy * ny) > reach:
+            return False
+    return True
+
+# Uniform grid over cull zone footprints
+#
+# Every zone is bucketed into the cells its XY bounds touch. Batched
+# point queries bucket the points by cell first, so each cell's zone list
+# is fetched once however many points fall into it.
+#######################################################
+class CullZoneIndex(object):
+
+    def __init__(self, cell_size=100.0):
+        self.cell_size = float(cell_size)
+        self.zones = []
+        self.cells = {}
+
+    #######################################################
+    def __len__(self):
+        return len(self.zones)
+
+    #######################################################
+    def cell_of(self, x, y):
+        return int(floor(x / self.cell_size)), int(floor(y / self.cell_size))
+
+    #######################################################
+    def build(self, zones):
+        self.zones = []
+        self.cells = {}
+        for zone in zones:
+            self.insert(zone)
+        return self
+
+    #######################################################
+    def insert(self, zone):
+        idx = len(self.zones)
+        self.zones.append(zone)
+        min_x, min_y, max_x, max_y = cull_zone_bounds(zone)
+        min_cx, min_cy = self.cell_of(min_x, min_y)
+        max_cx, max_cy = self.cell_of(max_x, max_y)
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                self.cells.setdefault((cx, cy), []).append(idx)
+        return idx
+
+    #######################################################
+    def query_point(self, point):
+        x, y, z = point
+        zones = self.zones
+        return [idx for idx in self.cells.get(self.cell_of(x, y), ())
+                if cull_zone_contains(zones[idx], x, y, z)]
+
+    #######################################################
+    def query_point_many(self, points):
+        result = [None] * len(points)
+        by_cell = {}
+        for i, point in enumerate(points):
+            by_cell.setdefault(self.cell_of(point[0], point[1]), []).append(i)
+
+        zones = self.zones
+        for key, indices in by_cell.items():
+            candidates = [(idx, zones[idx]) for idx in self.cells.get(key, ())]
+            for i in indices:
+                x, y, z = points[i]
+                result[i] = [idx for idx, zone in candidates if cull_zone_contains(zone, x, y, z)]
+        return result
+
+    #######################################################
+    def query_box(self, box_min, box_max):
+        min_cx, min_cy = self.cell_of(box_min[0], box_min[1])
+        max_cx, max_cy = self.cell_of(box_max[0], box_max[1])
+        candidates = set()
+        if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) > len(self.cells):
+            for key, items in self.cells.items():
+                if min_cx <= key[0] <= max_cx and min_cy <= key[1] <= max_cy:
+                    candidates.update(items)
+        else:
+            for cx in range(min_cx, max_cx + 1):
+                for cy in range(min_cy, max_cy + 1):
+                    candidates.update(self.cells.get((cx, cy), ()))
+        return sorted(idx for idx in candidates
+                      if cull_zone_overlaps_box(self.zones[idx], box_min, box_max))
+
+    #######################################################
+    def query_box_many(self, boxes):
+        return [self.query_box(box_min, box_max) for box_min, box_max in boxes]
@@ -0,0 +1,347 @@
+# GTA DragonFF IMG archive utility (2.79 compatible)
+# Python 3.5 safe: no dataclasses, no f-strings
+from __future__ import absolute_import, print_function
+
+import mmap
+import os
+from collections import namedtuple
+from struct import unpack_from, calcsize, pack
+
+SECTOR_SIZE = 2048
+
+# offset and size are in sectors
+ImgEntry = namedtuple("ImgEntry", "offset size name")
+
+V1_ENTRY_FORMAT = "<II24s"
+V2_HEADER_FORMAT = "<4sI"
+V2_ENTRY_FORMAT = "<IHH24s"
+
+#######################################################
+def decode_entry_name(name):
+    return name.split(b"\0", 1)[0].decode("latin-1")
+
+#######################################################
+def find_sibling(path, extension):
+    # The .dir/.img pair may not share the same case
+    directory, filename = os.path.split(path)
+    stem = os.path.splitext(filename)[0]
+    candidate = os.path.join(directory, stem + extension)
+    if os.path.isfile(candidate):
+        return candidate
+    wanted = (stem + extension).lower()
+    try:
+        for entry in os.listdir(directory or "."):
+            if entry.lower() == wanted:
+                return os.path.join(directory, entry)
+    except OSError:
+        pass
+    return None
+
+# Memory mapped reader for version 1 (.dir + .img) and version 2 (VER2) archives
+#######################################################
+class img(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.img_path = path
+        self.dir_path = None
+        self.version = None
+        self.entries = []
+        self.index = {}
+        self._file = None
+        self._map = None
+
+    #######################################################
+    @staticmethod
+    def open(path):
+        archive = img(path)
+        archive.load()
+        return archive
+
+    #######################################################
+    def __enter__(self):
+        return self
+
+    #######################################################
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    #######################################################
+    def __len__(self):
+        return len(self.entries)
+
+    #######################################################
+    def load(self):
+        if self.path.lower().endswith(".dir"):
+            self.dir_path = self.path
+            self.img_path = find_sibling(self.path, ".img")
+            if self.img_path is None:
+                raise IOError("IMG file for %s not found" % self.path)
+
+        self._file = open(self.img_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size > 0:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.dir_path is None and self._map is not None and self._map[:4] == b"VER2":
+            self.version = 2
+            self.entries = self.read_v2_directory(self._map)
+        else:
+            self.version = 1
+            if self.dir_path is None:
+                self.dir_path = find_sibling(self.img_path, ".dir")
+                if self.dir_path is None:
+                    self.close()
+                    raise IOError("DIR file for %s not found" % self.img_path)
+            with open(self.dir_path, "rb") as dir_file:
+                self.entries = self.read_v1_directory(dir_file.read())
+
+        self.build_index()
+
+    #######################################################
+    @staticmethod
+    def read_v1_directory(data):
+        entry_size = calcsize(V1_ENTRY_FORMAT)
+        entries = []
+        for pos in range(0, len(data) - entry_size + 1, entry_size):
+            offset, size, name = unpack_from(V1_ENTRY_FORMAT, data, pos)
+            entries.append(ImgEntry(offset, size, decode_entry_name(name)))
+        return entries
+
+    #######################################################
+    @staticmethod
+    def read_v2_directory(data):
+        _, count = unpack_from(V2_HEADER_FORMAT, data, 0)
+        pos = calcsize(V2_HEADER_FORMAT)
+        entry_size = calcsize(V2_ENTRY_FORMAT)
+        entries = []
+        for _ in range(count):
+            offset, streaming_size, archive_size, name = unpack_from(V2_ENTRY_FORMAT, data, pos)
+            entries.append(ImgEntry(offset, streaming_size or archive_size, decode_entry_name(name)))
+            pos += entry_size
+        return entries
+
+    #######################################################
+    def build_index(self):
+        self.index = {}
+        for idx, entry in enumerate(self.entries):
+            # First entry wins, like the game's streaming directory
+            self.index.setdefault(entry.name.lower(), idx)
+
+    #######################################################
+    def close(self):
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Entry views are still alive, the map is released with them
+                pass
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    #######################################################
+    def find_entry_idx(self, name):
+        return self.index.get(name.lower(), -1)
+
+    #######################################################
+    def read_entry(self, idx):
+        entry = self.entries[idx]
+        start = entry.offset * SECTOR_SIZE
+        end = start + entry.size * SECTOR_SIZE
+        if self._map is None or end > len(self._map):
+            raise IOError("IMG entry %s lies outside of the archive" % entry.name)
+        return entry.name, memoryview(self._map)[start:end]
+
+    #######################################################
+    def read_entry_by_name(self, name):
+        idx = self.find_entry_idx(name)
+        if idx < 0:
+            return None
+        return self.read_entry(idx)[1]
+
+#######################################################
+def sector_count(size):
+    return (size + SECTOR_SIZE - 1) // SECTOR_SIZE
+
+# In place writer for version 2 archives
+#
+# Changes are staged with add / remove and written by commit() in one
+# pass sorted by offset. Entries that still fit are rewritten where they
+# are, others go to the first free gap large enough or the end of the
+# archive. compact() rewrites the archive without gaps.
+#######################################################
+class ImgWriter(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        self.pending = {}
+        self.removed = set()
+
+        if os.path.isfile(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                header = f.read(calcsize(V2_HEADER_FORMAT))
+                if header[:4] != b"VER2":
+                    raise IOError("%s is not a version 2 IMG archive" % path)
+                count = unpack_from(V2_HEADER_FORMAT, header)[1]
+                f.seek(0)
+                self.entries = img.read_v2_directory(f.read(len(header) + count * calcsize(V2_ENTRY_FORMAT)))
+        else:
+            with open(path, "wb") as f:
+                f.write(self.directory_data([]))
+
+    #######################################################
+    def __enter__(self):
+        return self
+
+    #######################################################
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+    #######################################################
+    @staticmethod
+    def directory_sectors(count):
+        return sector_count(calcsize(V2_HEADER_FORMAT) + count * calcsize(V2_ENTRY_FORMAT))
+
+    #######################################################
+    @staticmethod
+    def directory_data(entries):
+        data = pack(V2_HEADER_FORMAT, b"VER2", len(entries))
+        for entry in entries:
+            data += pack(V2_ENTRY_FORMAT, entry.offset, entry.size, 0, entry.name.encode("latin-1"))
+        return data + b"\0" * (ImgWriter.directory_sectors(len(entries)) * SECTOR_SIZE - len(data))
+
+    #######################################################
+    def add(self, name, data):
+        if len(name.encode("latin-1")) > 23:
+            raise ValueError("IMG entry name too long: %s" % name)
+        if sector_count(len(data)) > 0xFFFF:
+            raise ValueError("IMG entry too large: %s" % name)
+        key = name.lower()
+        self.removed.discard(key)
+        self.pending[key] = (name, bytes(data))
+
+    replace = add
+
+    #######################################################
+    def remove(self, name):
+        key = name.lower()
+        self.pending.pop(key, None)
+        self.removed.add(key)
+
+    #######################################################
+    @staticmethod
+    def free_extents(used, start, end):
+        free = []
+        pos = start
+        for offset, size in sorted(used):
+            if offset > pos:
+                free.append([pos, offset - pos])
+            pos = max(pos, offset + size)
+        if end > pos:
+            free.append([pos, end - pos])
+        return free
+
+    #######################################################
+    def commit(self):
+        if not self.pending and not self.removed:
+            return
+
+        entries = [e for e in self.entries if e.name.lower() not in self.removed]
+        existing = dict((e.name.lower(), i) for i, e in enumerate(entries))
+        for key, (name, _) in self.pending.items():
+            if key not in existing:
+                existing[key] = len(entries)
+                entries.append(ImgEntry(0, 0, name))
+
+        dir_sectors = self.directory_sectors(len(entries))
+        writes = []
+
+        with open(self.path, "r+b") as f:
+            # Entries that stay put, replacements that still fit included
+            kept = {}
+            relocate = []
+            for idx, entry in enumerate(entries):
+                key = entry.name.lower()
+                size = entry.size
+                if key in self.pending:
+                    size = sector_count(len(self.pending[key][1]))
+                if entry.size and entry.offset >= dir_sectors and size <= entry.size:
+                    kept[idx] = (entry.offset, size)
+                else:
+                    relocate.append(idx)
+
+            end = max([offset + size for offset, size in kept.values()] + [dir_sectors])
+            free = self.free_extents(kept.values(), dir_sectors, end)
+
+            for idx in relocate:
+                entry = entries[idx]
+                key = entry.name.lower()
+                if key in self.pending:
+                    data = self.pending[key][1]
+                else:
+                    # Old data overlapping the grown directory has to move
+                    f.seek(entry.offset * SECTOR_SIZE)
+                    data = f.read(entry.size * SECTOR_SIZE)
+                size = sector_count(len(data))
+
+                offset = None
+                for extent in free:
+                    if extent[1] >= size:
+                        offset = extent[0]
+                        extent[0] += size
+                        extent[1] -= size
+                        break
+                if offset is None:
+                    offset = end
+                    end += size
+                entries[idx] = ImgEntry(offset, size, entry.name)
+                writes.append((offset, data))
+
+            for idx, (offset, size) in kept.items():
+                key = entries[idx].name.lower()
+                entries[idx] = ImgEntry(offset, size, entries[idx].name)
+                if key in self.pending:
+                    writes.append((offset, self.pending[key][1]))
+
+            # Single sequential pass over the archive
+            for offset, data in sorted(writes, key=lambda w: w[0]):
+                f.seek(offset * SECTOR_SIZE)
+                f.write(data)
+                f.write(b"\0" * (sector_count(len(data)) * SECTOR_SIZE - len(data)))
+
+            f.seek(0, os.SEEK_END)
+            if f.tell() < end * SECTOR_SIZE:
+                f.truncate(end * SECTOR_SIZE)
+
+            f.seek(0)
+            f.write(self.directory_data(entries))
+
+        self.entries = entries
+        self.pending = {}
+        self.removed = set()
+
+    #######################################################
+    def compact(self):
+        self.commit()
+        temp_path = self.path + ".tmp"
+        offset = self.directory_sectors(len(self.entries))
+        entries = []
+        with open(self.path, "rb") as src, open(temp_path, "wb") as dst:
+            dst.seek(offset * SECTOR_SIZE)
+            for entry in sorted(self.entries, key=lambda e: e.offset):
+                src.seek(entry.offset * SECTOR_SIZE)
+                dst.write(src.read(entry.size * SECTOR_SIZE))
+                entries.append((entry, ImgEntry(offset, entry.size, entry.name)))
+                offset += entry.size
+
+            # Keep the original directory order
+            moved = dict((id(old), new) for old, new in entries)
+            self.entries = [moved[id(e)] for e in self.entries]
+            dst.seek(0)
+            dst.write(self.directory_data(self.entries))
+
+        os.replace(temp_path, self.path)
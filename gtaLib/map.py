@@ -2,12 +2,41 @@
 # Python 3.5 safe: no dataclasses, no f-strings
 from __future__ import absolute_import, print_function
 
+import hashlib
+import mmap
 import os
+import pickle
+import re
 import struct
-from io import BytesIO, BufferedReader, StringIO
+import sys
+from array import array
+from collections import namedtuple
+from math import floor
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO, BufferedReader
 
+from .col import coll
+from .cull import CullZoneIndex, cull_zone_from_entry
 from .data import map_data
 from .img import img
+from .spatial import GridIndex
+
+#######################################################
+def instance_position(inst):
+    return float(inst.posX), float(inst.posY), float(inst.posZ)
+
+#######################################################
+def model_lookup(mapping, model_id, default=None):
+    # IDs are strings unless the map data was parsed typed
+    value = mapping.get(model_id)
+    if value is None:
+        value = mapping.get(str(model_id))
+    if value is None:
+        try:
+            value = mapping.get(int(model_id))
+        except ValueError:
+            pass
+    return default if value is None else value
 
 #######################################################
 class MapData(object):
@@ -15,6 +44,329 @@ class MapData(object):
         self.object_instances = object_instances
         self.object_data = object_data
         self.cull_instances = cull_instances
+        self.spatial_index = None
+        self.lod_graph = None
+        self.cull_index = None
+        self.model_registry = None
+        # [[read job, sections]] per IDE file, see MapDataUtility.run_read_jobs
+        self.ide_files = []
+        # All IDE paths the map draws on, ide_files may hold only a subset
+        self.ide_paths = []
+        # COL files and archives indexed into model_registry
+        self.col_paths = []
+
+    #######################################################
+    def build_spatial_index(self, cell_size=200.0, model_radii=None):
+        positions = [instance_position(inst) for inst in self.object_instances]
+        radii = None
+        if model_radii:
+            radii = [model_lookup(model_radii, inst.id, 0.0) for inst in self.object_instances]
+        self.spatial_index = GridIndex(cell_size).build(
+            [p[0] for p in positions], [p[1] for p in positions], [p[2] for p in positions], radii)
+        return self.spatial_index
+
+    #######################################################
+    def get_spatial_index(self):
+        if self.spatial_index is None or len(self.spatial_index) != len(self.object_instances):
+            self.build_spatial_index()
+        return self.spatial_index
+
+    #######################################################
+    def instances_in_box(self, box_min, box_max):
+        return [self.object_instances[i] for i in self.get_spatial_index().query_box(box_min, box_max)]
+
+    #######################################################
+    def instances_in_radius(self, center, radius):
+        return [self.object_instances[i] for i in self.get_spatial_index().query_radius(center, radius)]
+
+    #######################################################
+    def instances_in_frustum(self, planes):
+        return [self.object_instances[i] for i in self.get_spatial_index().query_frustum(planes)]
+
+    #######################################################
+    def build_cull_index(self, cell_size=100.0):
+        zones = [cull_zone_from_entry(entry) for entry in self.cull_instances]
+        self.cull_index = CullZoneIndex(cell_size).build(zones)
+        return self.cull_index
+
+    #######################################################
+    def get_cull_index(self):
+        if self.cull_index is None or len(self.cull_index) != len(self.cull_instances):
+            self.build_cull_index()
+        return self.cull_index
+
+    #######################################################
+    def cull_zones_at(self, points):
+        return self.get_cull_index().query_point_many(points)
+
+    #######################################################
+    def instance_cull_zones(self):
+        # Indices into cull_instances of the zones each instance lies in
+        return self.cull_zones_at([instance_position(inst) for inst in self.object_instances])
+
+    #######################################################
+    def get_lod_graph(self, lod_instances=None):
+        # lod_instances is the main IPL when object_instances come from a streamed IPL
+        if self.lod_graph is None or self.lod_graph.child_count != len(self.object_instances):
+            self.lod_graph = LodGraph.build(self.object_instances, lod_instances)
+        return self.lod_graph
+
+# Parent / child links between IPL instances given by their lod index
+#######################################################
+class LodGraph(object):
+
+    def __init__(self, parents, parent_count, self_referencing):
+        self.parents = parents
+        self.child_count = len(parents)
+        self.parent_count = parent_count
+        self.self_referencing = self_referencing
+        self.errors = []
+
+        # Children grouped per parent (CSR layout)
+        counts = [0] * (parent_count + 1)
+        for parent in parents:
+            if parent >= 0:
+                counts[parent + 1] += 1
+        for i in range(parent_count):
+            counts[i + 1] += counts[i]
+        self.child_start = array("i", counts)
+        children = array("i", bytes(4 * counts[-1]))
+        fill = list(counts[:-1])
+        for child, parent in enumerate(parents):
+            if parent >= 0:
+                children[fill[parent]] = child
+                fill[parent] += 1
+        self.children = children
+
+    #######################################################
+    @staticmethod
+    def build(instances, lod_instances=None):
+        self_referencing = lod_instances is None
+        parent_count = len(instances) if self_referencing else len(lod_instances)
+
+        parents = array("i", [parse_int(str(inst.lod)) for inst in instances])
+        errors = []
+        for idx, parent in enumerate(parents):
+            if parent < -1 or parent >= parent_count:
+                errors.append("Instance %d: LOD index %d out of range" % (idx, parent))
+                parents[idx] = -1
+            elif self_referencing and parent == idx:
+                errors.append("Instance %d: LOD references itself" % idx)
+                parents[idx] = -1
+
+        if self_referencing:
+            # Break cycles so walks up the hierarchy always terminate
+            state = bytearray(len(parents))
+            for start in range(len(parents)):
+                path = []
+                node = start
+                while node >= 0 and state[node] == 0:
+                    state[node] = 1
+                    path.append(node)
+                    node = parents[node]
+                if node >= 0 and state[node] == 1:
+                    errors.append("Instance %d: LOD cycle" % node)
+                    parents[path[-1]] = -1
+                for visited in path:
+                    state[visited] = 2
+
+        graph = LodGraph(parents, parent_count, self_referencing)
+        graph.errors = errors
+        for error in errors:
+            print("LodGraph Error:", error)
+        return graph
+
+    #######################################################
+    @staticmethod
+    def build_streamed(main_instances, streams):
+        # streams maps streamed IPL names to their instances, all linking into main_instances
+        main_graph = LodGraph.build(main_instances)
+        graphs = {}
+        for name in sorted(streams):
+            graph = LodGraph.build(streams[name], main_instances)
+            for parent in graph.lod_indices():
+                # A LOD is a top level main IPL instance, not an HD object linking further up
+                if main_graph.parents[parent] >= 0:
+                    error = "%s: LOD %d is itself linked to LOD %d" % (name, parent, main_graph.parents[parent])
+                    graph.errors.append(error)
+                    print("LodGraph Error:", error)
+            graphs[name] = graph
+        return main_graph, graphs
+
+    #######################################################
+    def lod_of(self, idx):
+        return self.parents[idx]
+
+    #######################################################
+    def children_of(self, parent):
+        return self.children[self.child_start[parent]:self.child_start[parent + 1]]
+
+    #######################################################
+    def lod_indices(self):
+        # Instances referenced as a LOD by at least one other instance
+        start = self.child_start
+        return [p for p in range(self.parent_count) if start[p + 1] > start[p]]
+
+    #######################################################
+    def hd_indices(self):
+        if not self.self_referencing:
+            return list(range(self.child_count))
+        start = self.child_start
+        return [i for i in range(self.child_count) if start[i + 1] == start[i]]
+
+    #######################################################
+    def renumber(self, deleted_children=(), deleted_parents=None):
+        # New lod values for the surviving children, O(n)
+        if deleted_parents is None:
+            deleted_parents = deleted_children if self.self_referencing else ()
+        removed_parents = bytearray(self.parent_count)
+        for idx in deleted_parents:
+            removed_parents[idx] = 1
+        new_index = array("i", bytes(4 * self.parent_count))
+        next_index = 0
+        for idx in range(self.parent_count):
+            if removed_parents[idx]:
+                new_index[idx] = -1
+            else:
+                new_index[idx] = next_index
+                next_index += 1
+
+        removed_children = bytearray(self.child_count)
+        for idx in deleted_children:
+            removed_children[idx] = 1
+        return [
+            new_index[parent] if parent >= 0 else -1
+            for child, parent in enumerate(self.parents) if not removed_children[child]
+        ]
+
+    #######################################################
+    def renumbered_instances(self, instances, deleted_children=(), deleted_parents=None):
+        deleted = set(deleted_children)
+        survivors = [inst for idx, inst in enumerate(instances) if idx not in deleted]
+        lods = self.renumber(deleted_children, deleted_parents)
+        return [
+            inst._replace(lod=lod if isinstance(inst.lod, int) else str(lod))
+            for inst, lod in zip(survivors, lods)
+        ]
+
+#######################################################
+def ipl_line(entry):
+    if isinstance(entry, str):
+        return entry
+    return ", ".join(str(value) for value in entry)
+
+# Partition of IPL instances into a main text IPL and streamed sectors
+#
+# LODs stay in the main IPL, which the game keeps resident, and everything
+# else is bucketed by position into grid cells. Cells holding more than
+# max_instances are split into quadrants until they fit. LOD indices are
+# rewritten to point into the main IPL, which is what streamed binary IPLs
+# link against.
+#######################################################
+class StreamedIPLSplit(object):
+
+    # Quadrant splits before a crowded spot is cut into plain chunks
+    MAX_DEPTH = 8
+
+    def __init__(self):
+        self.main_instances = []
+        # [(cell key, instances)] in stream file order
+        self.sectors = []
+        # Original index -> (-1 for main or sector number, index in that file)
+        self.locations = []
+
+    #######################################################
+    @staticmethod
+    def relink(inst, lod):
+        return inst._replace(lod=lod if isinstance(inst.lod, int) else str(lod))
+
+    #######################################################
+    @staticmethod
+    def build(instances, cell_size=500.0, max_instances=1000, keep_in_main=None):
+        split = StreamedIPLSplit()
+        graph = LodGraph.build(instances)
+
+        in_main = bytearray(len(instances))
+        for idx in graph.lod_indices():
+            in_main[idx] = 1
+        if keep_in_main is not None:
+            for idx, inst in enumerate(instances):
+                if keep_in_main(inst):
+                    in_main[idx] = 1
+
+        main_index = array("i", [-1] * len(instances))
+        main_order = [idx for idx in range(len(instances)) if in_main[idx]]
+        for new_idx, idx in enumerate(main_order):
+            main_index[idx] = new_idx
+
+        def new_lod(idx):
+            # Every LOD is in the main IPL, so this is defined for all linked instances
+            parent = graph.parents[idx]
+            return main_index[parent] if parent >= 0 else -1
+
+        split.locations = [None] * len(instances)
+        for new_idx, idx in enumerate(main_order):
+            split.main_instances.append(StreamedIPLSplit.relink(instances[idx], new_lod(idx)))
+            split.locations[idx] = (-1, new_idx)
+
+        cells = {}
+        for idx in range(len(instances)):
+            if not in_main[idx]:
+                x, y, _ = instance_position(instances[idx])
+                key = (int(floor(x / cell_size)), int(floor(y / cell_size)))
+                cells.setdefault(key, []).append(idx)
+
+        for key in sorted(cells):
+            x0, y0 = key[0] * cell_size, key[1] * cell_size
+            for group in StreamedIPLSplit.subdivide(instances, cells[key], x0, y0, cell_size,
+                                                    max_instances, 0):
+                sector = len(split.sectors)
+                split.sectors.append((key, [StreamedIPLSplit.relink(instances[idx], new_lod(idx))
+                                            for idx in group]))
+                for pos, idx in enumerate(group):
+                    split.locations[idx] = (sector, pos)
+        return split
+
+    #######################################################
+    @staticmethod
+    def subdivide(instances, indices, x0, y0, size, max_instances, depth):
+        if len(indices) <= max_instances:
+            return [indices]
+        if depth >= StreamedIPLSplit.MAX_DEPTH:
+            return [indices[i:i + max_instances] for i in range(0, len(indices), max_instances)]
+
+        half = size * 0.5
+        quadrants = ([], [], [], [])
+        for idx in indices:
+            x, y, _ = instance_position(instances[idx])
+            quadrants[(x >= x0 + half) + 2 * (y >= y0 + half)].append(idx)
+
+        groups = []
+        for q, quadrant in enumerate(quadrants):
+            if quadrant:
+                groups.extend(StreamedIPLSplit.subdivide(
+                    instances, quadrant, x0 + half * (q & 1), y0 + half * (q >> 1), half,
+                    max_instances, depth + 1))
+        return groups
+
+    #######################################################
+    def stream_name(self, name, sector):
+        return "%s_stream%d.ipl" % (name, sector)
+
+    #######################################################
+    def write(self, directory, name, game_id, cull_instances=()):
+        # Returns the paths written, main text IPL first
+        main_path = os.path.join(directory, name + ".ipl")
+        main_data = TextIPLData([ipl_line(inst) for inst in self.main_instances],
+                                [ipl_line(entry) for entry in cull_instances])
+        MapDataUtility.write_ipl_data(main_path, game_id, main_data)
+
+        paths = [main_path]
+        for sector, (_, instances) in enumerate(self.sectors):
+            path = os.path.join(directory, self.stream_name(name, sector))
+            MapDataUtility.write_ipl_data(path, game_id, TextIPLData(instances, []), binary=True)
+            paths.append(path)
+        return paths
 
 #######################################################
 class TextIPLData(object):
@@ -22,6 +374,132 @@ class TextIPLData(object):
         self.object_instances = object_instances
         self.cull_instances = cull_instances
 
+# Columnar view over fixed size binary IPL records
+#######################################################
+class BinaryRecords(object):
+
+    # (column name, array typecode) per 4 byte field, in file order
+    layout = ()
+
+    def __init__(self, data=b"", count=None):
+        stride = len(self.layout)
+        self.record_size = stride * 4
+        if count is None:
+            count = len(data) // self.record_size
+        data = bytes(data[:count * self.record_size])
+        self.count = len(data) // self.record_size
+
+        # Decode the whole block once per type, then take strided columns
+        decoded = {}
+        for typecode in set(t for _, t in self.layout):
+            values = array(typecode)
+            values.frombytes(data[:self.count * self.record_size])
+            if sys.byteorder != "little":
+                values.byteswap()
+            decoded[typecode] = values
+        for idx, (name, typecode) in enumerate(self.layout):
+            setattr(self, name, decoded[typecode][idx::stride])
+
+    #######################################################
+    @classmethod
+    def from_columns(cls, columns):
+        records = cls()
+        count = None
+        for name, typecode in cls.layout:
+            column = array(typecode, columns[name])
+            if count is not None and len(column) != count:
+                raise ValueError("Column %s has %d values, expected %d" % (name, len(column), count))
+            count = len(column)
+            setattr(records, name, column)
+        records.count = count or 0
+        return records
+
+    #######################################################
+    def __len__(self):
+        return self.count
+
+    #######################################################
+    def record(self, idx):
+        return tuple(getattr(self, name)[idx] for name, _ in self.layout)
+
+    #######################################################
+    def tobytes(self):
+        columns = [getattr(self, name) for name, _ in self.layout]
+        words = array("i", bytes(self.count * self.record_size))
+        for idx, (column, (_, typecode)) in enumerate(zip(columns, self.layout)):
+            if typecode != "i":
+                column = array("i", array(typecode, column).tobytes())
+            words[idx::len(columns)] = column
+        if sys.byteorder != "little":
+            words.byteswap()
+        return words.tobytes()
+
+#######################################################
+class InstanceRecords(BinaryRecords):
+
+    layout = (
+        ("pos_x", "f"), ("pos_y", "f"), ("pos_z", "f"),
+        ("rot_x", "f"), ("rot_y", "f"), ("rot_z", "f"), ("rot_w", "f"),
+        ("id", "i"), ("interior", "i"), ("lod", "i"),
+    )
+
+    #######################################################
+    def position(self, idx):
+        return self.pos_x[idx], self.pos_y[idx], self.pos_z[idx]
+
+    #######################################################
+    def rotation(self, idx):
+        return self.rot_x[idx], self.rot_y[idx], self.rot_z[idx], self.rot_w[idx]
+
+    #######################################################
+    @classmethod
+    def from_instances(cls, instances):
+        float_fields = ("posX", "posY", "posZ", "rotX", "rotY", "rotZ", "rotW")
+        columns = {}
+        for (name, _), field in zip(cls.layout, float_fields):
+            columns[name] = [float(getattr(inst, field)) for inst in instances]
+        for name in ("id", "interior", "lod"):
+            columns[name] = [parse_int(str(getattr(inst, name))) for inst in instances]
+        return cls.from_columns(columns)
+
+    #######################################################
+    def to_instances(self, data_structure, typed=False):
+        columns = (self.id, self.interior, self.pos_x, self.pos_y, self.pos_z,
+                   self.rot_x, self.rot_y, self.rot_z, self.rot_w, self.lod)
+        if typed:
+            return [
+                data_structure(obj_id, "", interior, x, y, z, rx, ry, rz, rw, lod)
+                for obj_id, interior, x, y, z, rx, ry, rz, rw, lod in zip(*columns)
+            ]
+        return [
+            data_structure(str(obj_id), "", str(interior), str(x), str(y), str(z),
+                           str(rx), str(ry), str(rz), str(rw), str(lod))
+            for obj_id, interior, x, y, z, rx, ry, rz, rw, lod in zip(*columns)
+        ]
+
+#######################################################
+class CarRecords(BinaryRecords):
+
+    layout = (
+        ("pos_x", "f"), ("pos_y", "f"), ("pos_z", "f"), ("angle", "f"),
+        ("id", "i"), ("primary_color", "i"), ("secondary_color", "i"),
+        ("force_spawn", "i"), ("alarm_probability", "i"), ("lock_probability", "i"),
+        ("unknown1", "i"), ("unknown2", "i"),
+    )
+
+# Binary ("bnry") IPL contents, as stored in SA streamed IPLs
+#######################################################
+class BinaryIPLData(object):
+
+    header_format = "<4s6i12i"
+    section_names = ("inst", "unk1", "unk2", "unk3", "cars", "unk4")
+
+    def __init__(self, counts=None, offsets=None, instances=None, cars=None):
+        self.counts = counts or dict((name, 0) for name in self.section_names)
+        self.offsets = offsets or dict((name, 0) for name in self.section_names)
+        self.instances = instances if instances is not None else InstanceRecords()
+        self.cars = cars if cars is not None else CarRecords()
+
 # Base for all IPL / IDE section reader / writer classes
 #######################################################
 class SectionUtility(object):
@@ -33,16 +511,15 @@ class SectionUtility(object):
         self.data_structures_dict = {len(ds._fields): ds for ds in data_structures}
 
     #######################################################
-    def read(self, file_stream):
+    def read_records(self, records, filename=None):
         entries = []
-        line = file_stream.readline().strip()
 
-        while line != "end" and line != "":
-            line_params = [e.strip() for e in line.split(",")]
+        # Append file name for IDEs (needed for collision lookups)
+        if filename is not None and not filename.lower().endswith(".ide"):
+            filename = None
 
-            # Append file name for IDEs (needed for collision lookups)
-            filename = os.path.basename(getattr(file_stream, "name", ""))
-            if filename.lower().endswith(".ide"):
+        for line_params in records:
+            if filename is not None:
                 line_params.append(filename)
 
             data_structure = self.get_data_structure(line_params)
@@ -60,8 +537,6 @@ class SectionUtility(object):
             else:
                 entries.append(data_structure(*line_params))
 
-            line = file_stream.readline().strip()
-
         return entries
 
     #######################################################
@@ -75,33 +550,617 @@ class SectionUtility(object):
             file_stream.write(str(line) + "\n")
         file_stream.write("end\n")
 
-# Utility for reading / writing to map data files (.IPL, .IDE)
 #######################################################
-class MapDataUtility(object):
+def parse_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        if value[:2].lower() == "0x":
+            return int(value, 16)
+        return int(float(value))
 
-    @staticmethod
-    def find_path_case_insensitive(base_path, filename):
-        current_path = os.path.join(base_path, filename)
-        if os.path.isfile(current_path):
-            return current_path
+# Field name -> value converter used by TypedSectionUtility
+#######################################################
+INT_FIELDS = frozenset(["id", "interior", "lod", "flags", "flag", "meshCount", "timeOn", "timeOff"])
+FLOAT_FIELD_PREFIXES = ("pos", "rot", "scale", "drawDistance", "center", "lowerLeft",
+                        "upperRight", "width", "bottom", "top", "wheelScale")
 
-        current_path = base_path
-        parts = os.path.normpath(filename).split(os.sep)
-        for part in parts:
+def field_converter(field_name):
+    if field_name in INT_FIELDS:
+        return parse_int
+    if field_name.startswith(FLOAT_FIELD_PREFIXES):
+        return float
+    return str
+
+# Section reader producing int / float fields instead of strings
+#######################################################
+class TypedSectionUtility(SectionUtility):
+
+    def __init__(self, section_name, data_structures=None):
+        super(TypedSectionUtility, self).__init__(section_name, data_structures)
+
+        # Several structures may share a field count, keep all of them in
+        # declaration order instead of letting the last one win
+        self.candidates = {}
+        for ds in data_structures or []:
+            converters = tuple(field_converter(f) for f in ds._fields)
+            self.candidates.setdefault(len(ds._fields), []).append((ds, converters))
+
+    #######################################################
+    def read_records(self, records, filename=None):
+        entries = []
+        if filename is not None and not filename.lower().endswith(".ide"):
+            filename = None
+
+        for line_params in records:
+            if filename is not None:
+                line_params.append(filename)
+
+            entry = self.convert(line_params)
+            if entry is not None:
+                entries.append(entry)
+
+        return entries
+
+    #######################################################
+    def convert(self, line_params):
+        candidates = self.candidates.get(len(line_params))
+        if not candidates:
+            print(type(self).__name__, "Error: No appropriate data structure found")
+            print("    Section name:", self.section_name)
+            print("    Line parameters:", str(line_params))
+            return None
+
+        for data_structure, converters in candidates:
             try:
-                entries = os.listdir(current_path)
-            except Exception:
+                return data_structure._make([c(v) for c, v in zip(converters, line_params)])
+            except ValueError:
+                continue
+
+        print(type(self).__name__, "Error: Line parameters do not convert.")
+        print("    Section name:", self.section_name)
+        print("    Data structures:", ", ".join(ds.__name__ for ds, _ in candidates))
+        print("    Line parameters:", str(line_params))
+        return None
+
+    #######################################################
+    @staticmethod
+    def to_columns(entries):
+        # Entries of one section may mix structures, group columns per structure
+        grouped = {}
+        for entry in entries:
+            grouped.setdefault(type(entry), []).append(entry)
+
+        result = {}
+        for data_structure, group in grouped.items():
+            columns = {}
+            for idx, name in enumerate(data_structure._fields):
+                values = [e[idx] for e in group]
+                if all(isinstance(v, float) for v in values):
+                    columns[name] = array("d", values)
+                elif all(isinstance(v, int) for v in values):
+                    columns[name] = array("q", values)
+                else:
+                    columns[name] = values
+            result[data_structure] = columns
+        return result
+
+# Tokenizer for text IPL / IDE data held as bytes, bytearray or mmap
+#
+# Section bounds are found with one regex search per section, so the file
+# is never decoded as a whole; records are decoded line by line as they
+# are consumed. Blank and comment lines are skipped.
+#######################################################
+class TextTokenizer(object):
+
+    END_PATTERN = re.compile(br"^[ \t]*end[ \t]*\r?$", re.M)
+
+    def __init__(self, data):
+        self.data = data
+
+    #######################################################
+    def sections(self):
+        # Yields (section name, body start, body end) byte offsets
+        data = self.data
+        size = len(data)
+        pos = 0
+        while pos < size:
+            line_end = data.find(b"\n", pos)
+            if line_end < 0:
+                line_end = size
+            header = data[pos:line_end].strip()
+            pos = line_end + 1
+            if not header or header[:1] == b"#":
+                continue
+
+            match = self.END_PATTERN.search(data, pos)
+            body_end = match.start() if match else size
+            yield header.decode("latin-1"), min(pos, size), body_end
+            pos = match.end() if match else size
+
+    #######################################################
+    def records(self, start, end):
+        # Walks the line boundaries in place, only the current line is copied
+        data = self.data
+        strip = str.strip
+        pos = start
+        while pos < end:
+            line_end = data.find(b"\n", pos, end)
+            if line_end < 0:
+                line_end = end
+            line = data[pos:line_end].strip()
+            pos = line_end + 1
+            if not line or line[:1] == b"#":
+                continue
+            yield list(map(strip, line.decode("latin-1").split(",")))
+
+# Case insensitive lookups below a game root, backed by cached directory listings
+#######################################################
+class PathResolver(object):
+
+    _resolvers = {}
+
+    def __init__(self, root):
+        self.root = root
+        # relative directory -> (actual path, mtime, {lowercase name: [actual names]})
+        self.listings = {}
+
+    #######################################################
+    @staticmethod
+    def for_root(root):
+        key = os.path.normcase(os.path.abspath(root))
+        resolver = PathResolver._resolvers.get(key)
+        if resolver is None:
+            resolver = PathResolver._resolvers[key] = PathResolver(root)
+        return resolver
+
+    #######################################################
+    @staticmethod
+    def clear():
+        PathResolver._resolvers.clear()
+
+    #######################################################
+    def invalidate(self):
+        self.listings.clear()
+
+    #######################################################
+    def _scan(self, key, actual_path):
+        try:
+            mtime = os.stat(actual_path).st_mtime
+            names = os.listdir(actual_path)
+        except OSError:
+            self.listings.pop(key, None)
+            return None
+        entries = {}
+        for name in names:
+            entries.setdefault(name.lower(), []).append(name)
+        listing = (actual_path, mtime, entries)
+        self.listings[key] = listing
+        return listing
+
+    #######################################################
+    def _lookup(self, key, actual_path, part):
+        listing = self.listings.get(key)
+        if listing is None:
+            listing = self._scan(key, actual_path)
+            if listing is None:
                 return None
-            match = None
-            for entry in entries:
-                if entry.lower() == part.lower():
-                    match = entry
-                    break
+
+        matches = listing[2].get(part.lower())
+        if matches is None:
+            # Only misses pay for a stat, rescan if the directory changed
+            try:
+                changed = os.stat(actual_path).st_mtime != listing[1]
+            except OSError:
+                changed = True
+            if changed:
+                listing = self._scan(key, actual_path)
+                if listing is not None:
+                    matches = listing[2].get(part.lower())
+        if not matches:
+            return None
+        # Names differing only in case can coexist on case sensitive file systems
+        return part if part in matches else matches[0]
+
+    #######################################################
+    def resolve(self, filename):
+        parts = [p for p in os.path.normpath(filename.replace("\\", "/")).split(os.sep) if p and p != "."]
+        if os.sep != "/":
+            parts = [q for p in parts for q in p.split("/") if q]
+
+        key = ""
+        current_path = self.root
+        for part in parts:
+            match = self._lookup(key, current_path, part)
             if match is None:
                 return None
+            key = key + "/" + match
             current_path = os.path.join(current_path, match)
         return current_path
 
+# IDE sections describing models, all start with "id, modelName, txdName"
+MODEL_SECTIONS = ("objs", "tobj", "anim", "cars", "peds", "weap", "hier")
+
+# Summary of one model definition; ide is the source IDE file name or None
+ModelRecord = namedtuple("ModelRecord", "id section modelName txdName ide")
+
+# Lookups of model definitions across all loaded IDE files, and of the COL
+# files holding each model's collision when those were indexed
+#
+# Only plain values are kept, so the registry can be pickled into the map
+# cache; the full IDE entries of objs / tobj stay in MapData.object_data.
+#######################################################
+class ModelRegistry(object):
+
+    def __init__(self):
+        # id -> (id, section name, model name, txd name, IDE file name)
+        self.models = {}
+        self.by_name = {}
+        self.by_txd = {}
+        self.by_ide = {}
+        # model name (lowercase) -> COL file name, and COL file name -> model names
+        self.collisions = {}
+        self.by_col = {}
+        self.duplicates = []
+
+    #######################################################
+    @staticmethod
+    def build(ide):
+        registry = ModelRegistry()
+        for section_name in MODEL_SECTIONS:
+            for entry in ide.get(section_name, ()):
+                registry.add(section_name, entry)
+        return registry
+
+    #######################################################
+    def __len__(self):
+        return len(self.models)
+
+    #######################################################
+    def __contains__(self, model_id):
+        return self.normalise_id(model_id) in self.models
+
+    #######################################################
+    @staticmethod
+    def normalise_id(model_id):
+        # None for ids that are not numeric
+        if isinstance(model_id, int):
+            return model_id
+        try:
+            return parse_int(str(model_id).strip())
+        except ValueError:
+            return None
+
+    #######################################################
+    @staticmethod
+    def from_index(index):
+        # Built from the id / name / txd scan of IdeIndex, no IDE is parsed
+        registry = ModelRegistry()
+        for _, source, rows in index.files:
+            for model_id, section_name, model_name, txd_name in rows:
+                registry.insert(model_id, section_name, model_name, txd_name, source)
+        return registry
+
+    #######################################################
+    def add(self, section_name, entry):
+        model_id = self.normalise_id(entry[0])
+        if model_id is None:
+            print("ModelRegistry Error: invalid model ID, entry skipped")
+            print("    Section name:", section_name)
+            print("    Line parameters:", str(list(entry)))
+            return
+
+        # Readers append the source IDE file name as the last field
+        source = str(entry[-1])
+        if not source.lower().endswith(".ide"):
+            source = None
+        self.insert(model_id, section_name, str(entry[1]), str(entry[2]), source)
+
+    #######################################################
+    def insert(self, model_id, section_name, model_name, txd_name, source=None):
+        if model_id in self.models:
+            self.duplicates.append(model_id)
+        self.models[model_id] = (model_id, section_name, model_name, txd_name, source)
+        self.by_name[model_name.lower()] = model_id
+        self.by_txd.setdefault(txd_name.lower(), []).append(model_id)
+        if source is not None:
+            self.by_ide.setdefault(source.lower(), []).append(model_id)
+
+    #######################################################
+    def get(self, model_id):
+        model = self.models.get(self.normalise_id(model_id))
+        return ModelRecord._make(model) if model is not None else None
+
+    #######################################################
+    def section_of(self, model_id):
+        model = self.models.get(self.normalise_id(model_id))
+        return model[1] if model is not None else None
+
+    #######################################################
+    def id_of(self, model_name):
+        return self.by_name.get(model_name.lower())
+
+    #######################################################
+    def ids_for_txd(self, txd_name):
+        return self.by_txd.get(txd_name.lower(), [])
+
+    #######################################################
+    def ids_in_ide(self, ide_name):
+        return self.by_ide.get(os.path.basename(ide_name).lower(), [])
+
+    #######################################################
+    def ide_of(self, model_id):
+        model = self.models.get(self.normalise_id(model_id))
+        return model[4] if model is not None else None
+
+    #######################################################
+    def add_collision_file(self, col_name, model_names):
+        names = self.by_col.setdefault(col_name.lower(), [])
+        for model_name in model_names:
+            # Later files win, as when the game loads them
+            self.collisions[model_name.lower()] = col_name
+            names.append(model_name)
+
+    #######################################################
+    def col_of(self, model_id):
+        model = self.models.get(self.normalise_id(model_id))
+        return self.collisions.get(model[2].lower()) if model is not None else None
+
+    #######################################################
+    def models_in_col(self, col_name):
+        return self.by_col.get(os.path.basename(col_name).lower(), [])
+
+    #######################################################
+    def resolve_instances(self, instances):
+        models = self.models
+        result = []
+        for inst in instances:
+            model = models.get(self.normalise_id(inst.id))
+            result.append(ModelRecord._make(model) if model is not None else None)
+        return result
+
+# Model id -> (IDE path, section name) over a set of IDE files
+#
+# Only the leading id, model and txd name of each line are scanned, so the
+# IDEs an IPL depends on can be found, and the model registry filled,
+# without parsing them.
+#######################################################
+class IdeIndex(object):
+
+    def __init__(self):
+        self.locations = {}
+        self.ide_paths = []
+        # [(IDE path, file name, [(id, section name, model name, txd name)])]
+        self.files = []
+
+    #######################################################
+    @staticmethod
+    def scan_file(filepath):
+        rows = []
+        section = None
+        with open(filepath, "rb") as f:
+            for line in f:
+                line = line.split(b"#", 1)[0].strip()
+                if not line:
+                    continue
+                if section is None:
+                    section = line.decode("latin-1")
+                elif line == b"end":
+                    section = None
+                elif section in MODEL_SECTIONS:
+                    fields = [field.strip().decode("latin-1") for field in line.split(b",", 3)[:3]]
+                    fields += [""] * (3 - len(fields))
+                    try:
+                        rows.append((parse_int(fields[0]), section, fields[1], fields[2]))
+                    except ValueError:
+                        print("IdeIndex Error: invalid model ID, line skipped")
+                        print("    File:", filepath)
+                        print("    Line:", line.decode("latin-1"))
+        return rows
+
+    #######################################################
+    @staticmethod
+    def build(game_root, ide_paths, cache_dir=None):
+        index = IdeIndex()
+        index.ide_paths = list(ide_paths)
+        cache = MapDataCache(cache_dir) if cache_dir is not None else None
+        for ide_path in ide_paths:
+            fullpath = MapDataUtility.get_full_path(game_root, ide_path)
+            rows = cache.load(fullpath, "models", MODEL_SECTIONS) if cache is not None else None
+            if rows is None:
+                try:
+                    rows = IdeIndex.scan_file(fullpath)
+                except (OSError, IOError) as e:
+                    print("Warning: could not index", fullpath, e)
+                    continue
+                if cache is not None:
+                    cache.store(fullpath, "models", MODEL_SECTIONS, rows)
+            index.files.append((ide_path, os.path.basename(fullpath), rows))
+            # Later IDEs win, like the object_data merge in load_map_data
+            for model_id, section_name, _, _ in rows:
+                index.locations[model_id] = (ide_path, section_name)
+        return index
+
+    #######################################################
+    def resolve(self, model_ids):
+        # Returns ([(ide path, section names)] in ide_paths order, missing ids)
+        needed = {}
+        missing = []
+        for model_id in model_ids:
+            location = self.locations.get(model_id)
+            if location is None:
+                missing.append(model_id)
+            else:
+                needed.setdefault(location[0], set()).add(location[1])
+        dependencies = [(p, needed[p]) for p in self.ide_paths if p in needed]
+        return dependencies, sorted(missing)
+
+# Bump whenever the parsed output of read_file changes
+PARSER_VERSION = 2
+
+# Entries are namedtuples of the map_data structures, which are declared
+# inline and cannot be pickled by reference. Caches and worker processes
+# exchange plain tuples grouped by structure name instead.
+#######################################################
+def pack_sections(sections):
+    packed = {}
+    for section_name, entries in sections.items():
+        runs = []
+        for entry in entries:
+            name = type(entry).__name__
+            if not runs or runs[-1][0] != name:
+                runs.append((name, []))
+            runs[-1][1].append(tuple(entry))
+        packed[section_name] = runs
+    return packed
+
+#######################################################
+def unpack_sections(packed, data_structures):
+    # None when the structures no longer match the packed data
+    by_name = dict((ds.__name__, ds) for ds in data_structures.values())
+    sections = {}
+    for section_name, runs in packed.items():
+        entries = []
+        for name, rows in runs:
+            data_structure = by_name.get(name)
+            if data_structure is None:
+                return None
+            entries.extend(map(data_structure._make, rows))
+        sections[section_name] = entries
+    return sections
+
+# On disk cache of parsed map files, one entry per source file
+#######################################################
+class MapDataCache(object):
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    #######################################################
+    @staticmethod
+    def structures_signature(data_structures, aliases):
+        signature = [PARSER_VERSION]
+        for name in sorted(data_structures):
+            ds = data_structures[name]
+            signature.append((name, ds.__name__, ds._fields))
+        for name in sorted(aliases):
+            signature.append((name, tuple(aliases[name])))
+        return hashlib.sha1(repr(signature).encode("utf-8")).hexdigest()
+
+    #######################################################
+    @staticmethod
+    def source_stamp(filepath):
+        st = os.stat(filepath)
+        return st.st_size, st.st_mtime_ns
+
+    #######################################################
+    def entry_path(self, filepath, tag, signature):
+        # One entry per source and structure set, so reading a section subset
+        # does not evict the full parse of the same file
+        key = "%s|%s|%s" % (os.path.normcase(os.path.abspath(filepath)), tag, signature)
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".cache")
+
+    #######################################################
+    def load(self, filepath, tag, signature):
+        try:
+            stamp = self.source_stamp(filepath)
+            with open(self.entry_path(filepath, tag, signature), "rb") as f:
+                header = pickle.load(f)
+                if header != (PARSER_VERSION, signature, os.path.abspath(filepath), stamp):
+                    return None
+                return pickle.load(f)
+        except (OSError, IOError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+
+    #######################################################
+    @staticmethod
+    def remove_temp(temp_path):
+        try:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+        except OSError:
+            pass
+
+    #######################################################
+    def store(self, filepath, tag, signature, value):
+        temp_path = None
+        try:
+            stamp = self.source_stamp(filepath)
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            path = self.entry_path(filepath, tag, signature)
+            temp_path = "%s.%d.tmp" % (path, os.getpid())
+            with open(temp_path, "wb") as f:
+                pickle.dump((PARSER_VERSION, signature, os.path.abspath(filepath), stamp), f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+            temp_path = None
+        except (OSError, IOError, pickle.PicklingError, AttributeError, TypeError) as e:
+            print("Warning: could not write map cache for", filepath, e)
+        finally:
+            self.remove_temp(temp_path)
+
+    #######################################################
+    def registry_header(self, filepaths, signature):
+        stamps = []
+        for filepath in filepaths:
+            try:
+                stamps.append(self.source_stamp(filepath))
+            except OSError:
+                stamps.append(None)
+        return (PARSER_VERSION, signature, [os.path.abspath(p) for p in filepaths], stamps)
+
+    #######################################################
+    def load_registry(self, filepaths, signature):
+        try:
+            with open(self.entry_path("\n".join(filepaths), "registry", signature), "rb") as f:
+                if pickle.load(f) != self.registry_header(filepaths, signature):
+                    return None
+                return pickle.load(f)
+        except (OSError, IOError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+
+    #######################################################
+    def store_registry(self, filepaths, signature, registry):
+        temp_path = None
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            path = self.entry_path("\n".join(filepaths), "registry", signature)
+            temp_path = "%s.%d.tmp" % (path, os.getpid())
+            with open(temp_path, "wb") as f:
+                pickle.dump(self.registry_header(filepaths, signature), f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(registry, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+            temp_path = None
+        except (OSError, IOError, pickle.PicklingError, AttributeError, TypeError) as e:
+            print("Warning: could not write model registry cache", e)
+        finally:
+            self.remove_temp(temp_path)
+
+    #######################################################
+    def read_file(self, filepath, data_structures, aliases, typed=False, verbose=True):
+        signature = self.structures_signature(data_structures, aliases)
+        tag = "typed" if typed else "text"
+        packed = self.load(filepath, tag, signature)
+        if packed is not None:
+            sections = unpack_sections(packed, data_structures)
+            if sections is not None:
+                return sections
+
+        sections = MapDataUtility.read_file(filepath, data_structures, aliases, typed, verbose)
+        if sections and os.path.isfile(filepath):
+            self.store(filepath, tag, signature, pack_sections(sections))
+        return sections
+
+# Utility for reading / writing to map data files (.IPL, .IDE)
+#######################################################
+class MapDataUtility(object):
+
+    @staticmethod
+    def find_path_case_insensitive(base_path, filename):
+        return PathResolver.for_root(base_path).resolve(filename)
+
     @staticmethod
     def is_binary_ipl_stream(file_stream):
         current_pos = file_stream.tell()
@@ -131,89 +1190,172 @@ class MapDataUtility(object):
         return result
 
     @staticmethod
-    def read_binary_ipl_from_stream(file_stream, data_structures):
-        sections = {}
-        start_pos = file_stream.tell()
-        header = file_stream.read(32)
-        if len(header) < 32:
+    def read_binary_ipl(file_stream):
+        data = file_stream.read()
+        header_size = struct.calcsize(BinaryIPLData.header_format)
+        if len(data) < header_size:
             print("Error: Invalid binary IPL file - header too short")
+            return None
+
+        header = struct.unpack_from(BinaryIPLData.header_format, data)
+        names = BinaryIPLData.section_names
+        counts = dict(zip(names, header[1:7]))
+        # Each offset is followed by an unused int
+        offsets = dict(zip(names, header[7::2]))
+
+        def records(cls, name):
+            offset = offsets[name]
+            size = counts[name] * len(cls.layout) * 4
+            available = max(0, len(data) - offset)
+            if counts[name] and size > available:
+                print("Warning: %s section truncated, reached EOF" % name)
+            return cls(data[offset:offset + size]) if counts[name] else cls()
+
+        return BinaryIPLData(counts, offsets, records(InstanceRecords, "inst"), records(CarRecords, "cars"))
+
+    @staticmethod
+    def read_binary_ipl_from_stream(file_stream, data_structures, typed=False):
+        sections = {}
+        ipl = MapDataUtility.read_binary_ipl(file_stream)
+        if ipl is None:
             return sections
 
-        _, num_of_instances, _, _, _, _, _, instances_offset = struct.unpack("4siiiiiii", header)
-
-        item_size = 40
-        insts = []
-        file_stream.seek(start_pos + instances_offset)
-        for i in range(num_of_instances):
-            instances = file_stream.read(item_size)
-            if len(instances) < item_size:
-                print("Warning: Could not read instance %d, reached EOF" % i)
-                break
-            vals_unpacked = struct.unpack("fffffffiii", instances)
-            x_pos, y_pos, z_pos, x_rot, y_rot, z_rot, w_rot, obj_id, interior, lod = vals_unpacked
-            vals = [obj_id, "", interior, x_pos, y_pos, z_pos, x_rot, y_rot, z_rot, w_rot, lod]
-            insts.append(data_structures["inst"](*[str(v) for v in vals]))
-
-        sections["inst"] = insts
-        print("inst: %d entries" % len(insts))
+        sections["inst"] = ipl.instances.to_instances(data_structures["inst"], typed)
+        print("inst: %d entries" % len(sections["inst"]))
+        if len(ipl.cars):
+            print("cars: %d entries" % len(ipl.cars))
         return sections
 
     @staticmethod
-    def read_text_file_from_stream(file_stream, data_structures, aliases):
+    def section_utility(section_name, data_structures, aliases, typed=False):
+        utility_class = TypedSectionUtility if typed else SectionUtility
+        if section_name in aliases:
+            available_data_structures = [data_structures[s] for s in aliases[section_name]]
+            return utility_class(section_name, available_data_structures)
+        if section_name in data_structures:
+            return utility_class(section_name, [data_structures[section_name]])
+        return None
+
+    @staticmethod
+    def read_text_file_from_stream(file_stream, data_structures, aliases, typed=False, verbose=True):
+        # Same rules as files read from disk, blank lines do not end the data
+        data = file_stream.read()
+        if not isinstance(data, bytes):
+            data = data.encode("latin-1")
+        filename = os.path.basename(getattr(file_stream, "name", "") or "")
+        return MapDataUtility.read_text_file_from_bytes(data, data_structures, aliases, typed, verbose, filename)
+
+    @staticmethod
+    def read_text_file_from_bytes(data, data_structures, aliases, typed=False, verbose=True, filename=None):
         sections = {}
-        line = file_stream.readline().strip()
-        while line:
-            section_name = line
-            section_utility = None
-            if section_name in aliases:
-                available_data_structures = [data_structures[s] for s in aliases[line]]
-                section_utility = SectionUtility(section_name, available_data_structures)
-            elif section_name in data_structures:
-                section_utility = SectionUtility(section_name, [data_structures[section_name]])
+        tokenizer = TextTokenizer(data)
+        for section_name, start, end in tokenizer.sections():
+            section_utility = MapDataUtility.section_utility(section_name, data_structures, aliases, typed)
             if section_utility is not None:
-                sections[section_name] = section_utility.read(file_stream)
-                print("%s: %d entries" % (section_name, len(sections[section_name])))
-            line = file_stream.readline().strip()
+                sections[section_name] = section_utility.read_records(tokenizer.records(start, end), filename)
+                if verbose:
+                    print("%s: %d entries" % (section_name, len(sections[section_name])))
         return sections
 
     @staticmethod
-    def read_file(filepath, data_structures, aliases):
+    def read_file(filepath, data_structures, aliases, typed=False, verbose=True):
         self = MapDataUtility
         sections = {}
         try:
             with open(filepath, "rb") as file_stream:
                 if self.is_binary_ipl_stream(file_stream):
-                    sections = self.read_binary_ipl_from_stream(file_stream, data_structures)
-                else:
-                    binary_data = file_stream.read()
-                    text_data = binary_data.decode("latin-1")
-                    text_stream = StringIO(text_data)
-                    text_stream.name = filepath
-                    sections = self.read_text_file_from_stream(text_stream, data_structures, aliases)
+                    sections = self.read_binary_ipl_from_stream(file_stream, data_structures, typed)
+                elif os.fstat(file_stream.fileno()).st_size > 0:
+                    data = mmap.mmap(file_stream.fileno(), 0, access=mmap.ACCESS_READ)
+                    try:
+                        sections = self.read_text_file_from_bytes(
+                            data, data_structures, aliases, typed, verbose, os.path.basename(filepath))
+                    finally:
+                        data.close()
         except Exception as e:
             print("Error reading file:", filepath, e)
         return sections
 
     @staticmethod
-    def load_ide_data(game_root, ide_paths, data_structures, aliases):
-        self = MapDataUtility
+    def run_read_jobs(jobs, workers=None, use_processes=False):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = min(workers, len(jobs))
+
+        # Files are parsed independently. Parsing is CPU bound and holds the
+        # GIL, so it only runs in parallel in worker processes
+        if workers > 1 and use_processes:
+            process_jobs = [(path, structure_spec(ds), aliases, typed, cache_dir)
+                            for path, ds, aliases, typed, cache_dir in jobs]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                packed = list(executor.map(read_file_process_job, process_jobs))
+            results = [unpack_sections(p, job[1]) for p, job in zip(packed, jobs)]
+        else:
+            results = [read_file_job(job) for job in jobs]
+        return [[job, sections] for job, sections in zip(jobs, results)]
+
+    @staticmethod
+    def merge_ide_files(ide_files, verbose=True):
+        # Merge once, in job order, so duplicate ID reports stay deterministic
         ide = {}
-        for file in ide_paths:
-            fullpath = self.get_full_path(game_root, file)
-            print("\nMapDataUtility reading:", fullpath)
-            sections = self.read_file(fullpath, data_structures, aliases)
-            ide = self.merge_dols(ide, sections)
+        for job, sections in ide_files:
+            if verbose:
+                print("\nMapDataUtility reading:", job[0])
+            for section_name, entries in sections.items():
+                if verbose:
+                    print("%s: %d entries" % (section_name, len(entries)))
+                ide.setdefault(section_name, []).extend(entries)
         return ide
 
     @staticmethod
-    def load_ipl_data(game_root, ipl_section, data_structures, aliases):
+    def load_ide_data(game_root, ide_paths, data_structures, aliases, typed=False,
+                      workers=None, use_processes=False, cache_dir=None):
+        self = MapDataUtility
+        fullpaths = [self.get_full_path(game_root, file) for file in ide_paths]
+        jobs = [(path, data_structures, aliases, typed, cache_dir) for path in fullpaths]
+        return self.merge_ide_files(self.run_read_jobs(jobs, workers, use_processes))
+
+    @staticmethod
+    def section_structures(data_structures, aliases, section_names):
+        # Subset of the structures and aliases that reads only section_names
+        section_aliases = dict((k, v) for k, v in aliases.items() if k in section_names)
+        structures = dict((k, v) for k, v in data_structures.items() if k in section_names)
+        for names in section_aliases.values():
+            for name in names:
+                structures[name] = data_structures[name]
+        return structures, section_aliases
+
+    @staticmethod
+    def instance_model_ids(instances):
+        return set(parse_int(str(inst.id).strip()) for inst in instances)
+
+    @staticmethod
+    def load_ide_dependencies(game_root, ide_paths, model_ids, data_structures, aliases, typed=False,
+                              workers=None, use_processes=False, cache_dir=None, index=None):
+        # Reads only the IDE sections defining model_ids, returns (ide, [[read job, sections]])
+        self = MapDataUtility
+        if index is None:
+            index = IdeIndex.build(game_root, ide_paths, cache_dir)
+        dependencies, missing = index.resolve(model_ids)
+        if missing:
+            print("Warning: %d model IDs not defined in any IDE:" % len(missing), missing[:20])
+
+        jobs = []
+        for ide_path, section_names in dependencies:
+            structures, section_aliases = self.section_structures(data_structures, aliases, section_names)
+            jobs.append((self.get_full_path(game_root, ide_path), structures, section_aliases, typed, cache_dir))
+        ide_files = self.run_read_jobs(jobs, workers, use_processes)
+        return self.merge_ide_files(ide_files), ide_files
+
+    @staticmethod
+    def load_ipl_data(game_root, ipl_section, data_structures, aliases, typed=False, cache_dir=None):
         self = MapDataUtility
         ipl = {}
         fullpath = self.get_full_path(game_root, ipl_section)
         print("\nMapDataUtility reading:", fullpath)
 
         if not os.path.isfile(fullpath):
-            imgpath = os.path.join(game_root, "models/gta3.img")
+            imgpath = self.get_full_path(game_root, "models/gta3.img")
             try:
                 with img.open(imgpath) as img_file:
                     basename = os.path.basename(ipl_section)
@@ -222,17 +1364,21 @@ class MapDataUtility(object):
                         print("Read binary IPL from gta3.img:", basename)
                         _, data = img_file.read_entry(entry_idx)
                         file_stream = BufferedReader(BytesIO(data))
-                        sections = MapDataUtility.read_binary_ipl_from_stream(file_stream, data_structures)
+                        sections = MapDataUtility.read_binary_ipl_from_stream(file_stream, data_structures, typed)
                         ipl = self.merge_dols(ipl, sections)
                         return ipl
             except Exception as e:
                 print("Warning: gta3.img not found or unreadable:", e)
 
-        sections = self.read_file(fullpath, data_structures, aliases)
+        if cache_dir is not None:
+            sections = MapDataCache(cache_dir).read_file(fullpath, data_structures, aliases, typed)
+        else:
+            sections = self.read_file(fullpath, data_structures, aliases, typed)
         return self.merge_dols(ipl, sections)
 
     @staticmethod
-    def load_map_data(game_id, game_root, ipl_section, is_custom_ipl):
+    def load_map_data(game_id, game_root, ipl_section, is_custom_ipl, typed=False, cache_dir=None,
+                      resolve_ide=True, workers=None, use_processes=False, col_paths=()):
         self = MapDataUtility
         data = map_data.data[game_id].copy()
 
@@ -244,40 +1390,100 @@ class MapDataUtility(object):
                         fullpath = os.path.join(root_path, file)
                         ide_paths.append(os.path.relpath(fullpath, game_root))
             data["IDE_paths"] = ide_paths
+
+        ipl = self.load_ipl_data(game_root, ipl_section, data["structures"], data["IPL_aliases"],
+                                 typed, cache_dir)
+
+        index = None
+        if resolve_ide and ipl.get("inst"):
+            # Only the IDE sections defining the models the IPL places feed
+            # object_data, the registry is filled from the id scan of every IDE
+            index = IdeIndex.build(game_root, data["IDE_paths"], cache_dir)
+            model_ids = self.instance_model_ids(ipl["inst"])
+            ide, ide_files = self.load_ide_dependencies(
+                game_root, data["IDE_paths"], model_ids, data["structures"], data["IDE_aliases"],
+                typed, workers, use_processes, cache_dir, index)
         else:
-            if game_id == map_data.game_version.SA:
-                data["IDE_paths"] = list(data["IDE_paths"])
-                for p in list(data["IDE_paths"]):
-                    if p.startswith("DATA/MAPS/generic/") or p.startswith("DATA/MAPS/leveldes/") or "xref" in p:
-                        continue
-                    ide_prefix = p.split("/")[-1].lower()
-                    ipl_prefix = ipl_section.split("/")[-1].lower()[:3]
-                    if not ide_prefix.startswith(ipl_prefix):
-                        data["IDE_paths"].remove(p)
-
-        ide = self.load_ide_data(game_root, data["IDE_paths"], data["structures"], data["IDE_aliases"])
-        ipl = self.load_ipl_data(game_root, ipl_section, data["structures"], data["IPL_aliases"])
+            ide_paths = data["IDE_paths"]
+            if not is_custom_ipl and game_id == map_data.game_version.SA:
+                ipl_prefix = ipl_section.split("/")[-1].lower()[:3]
+                ide_paths = [
+                    p for p in ide_paths
+                    if p.startswith("DATA/MAPS/generic/") or p.startswith("DATA/MAPS/leveldes/") or "xref" in p
+                    or p.split("/")[-1].lower().startswith(ipl_prefix)
+                ]
+            jobs = [(self.get_full_path(game_root, p), data["structures"], data["IDE_aliases"], typed, cache_dir)
+                    for p in ide_paths]
+            ide_files = self.run_read_jobs(jobs, workers, use_processes)
+            ide = self.merge_ide_files(ide_files)
 
         object_instances = []
         cull_instances = []
-        object_data = {}
 
         if "inst" in ipl:
             object_instances.extend(ipl["inst"])
         if "cull" in ipl:
             cull_instances.extend(ipl["cull"])
+        object_data = self.merge_object_data(ide)
+
+        result = MapData(object_instances, object_data, cull_instances)
+        result.ide_files = ide_files
+        result.ide_paths = data["IDE_paths"]
+        result.col_paths = list(col_paths)
+        result.model_registry = self.load_model_registry(game_root, data["IDE_paths"], cache_dir, col_paths, index)
+        return result
+
+    @staticmethod
+    def merge_object_data(ide, verbose=True):
+        object_data = {}
         if "objs" in ide:
             for entry in ide["objs"]:
-                if entry.id in object_data:
+                if entry.id in object_data and verbose:
                     print("OBJ ERROR! duplicate ID:", entry.id)
                 object_data[entry.id] = entry
         if "tobj" in ide:
             for entry in ide["tobj"]:
-                if entry.id in object_data:
+                if entry.id in object_data and verbose:
                     print("TOBJ ERROR! duplicate ID:", entry.id)
                 object_data[entry.id] = entry
+        return object_data
 
-        return MapData(object_instances, object_data, cull_instances)
+    @staticmethod
+    def index_collision_files(registry, game_root, col_paths):
+        # COL files, or IMG archives whose .col entries are indexed
+        for col_path in col_paths:
+            fullpath = MapDataUtility.get_full_path(game_root, col_path)
+            try:
+                if fullpath.lower().endswith(".img"):
+                    with img.open(fullpath) as archive:
+                        for idx, entry in enumerate(archive.entries):
+                            if entry.name.lower().endswith(".col"):
+                                data = archive.read_entry(idx)[1]
+                                registry.add_collision_file(entry.name, list(coll.iter_model_names(data)))
+                                data.release()
+                else:
+                    registry.add_collision_file(os.path.basename(fullpath), list(coll.iter_model_names(fullpath)))
+            except (OSError, IOError) as e:
+                print("Warning: could not index collisions of", fullpath, e)
+        return registry
+
+    @staticmethod
+    def load_model_registry(game_root, ide_paths, cache_dir=None, col_paths=(), index=None):
+        self = MapDataUtility
+        fullpaths = [self.get_full_path(game_root, file) for file in ide_paths]
+        col_fullpaths = [self.get_full_path(game_root, file) for file in col_paths]
+        cache = MapDataCache(cache_dir) if cache_dir is not None else None
+        signature = repr(MODEL_SECTIONS)
+
+        registry = cache.load_registry(fullpaths + col_fullpaths, signature) if cache is not None else None
+        if registry is None:
+            if index is None:
+                index = IdeIndex.build(game_root, ide_paths, cache_dir)
+            registry = ModelRegistry.from_index(index)
+            self.index_collision_files(registry, game_root, col_fullpaths)
+            if cache is not None:
+                cache.store_registry(fullpaths + col_fullpaths, signature, registry)
+        return registry
 
     @staticmethod
     def write_text_ipl_to_stream(file_stream, game_id, ipl_data):
@@ -298,7 +1504,322 @@ class MapDataUtility(object):
                 section_utility.write(file_stream, [])
 
     @staticmethod
-    def write_ipl_data(filename, game_id, ipl_data):
+    def write_binary_ipl_to_stream(file_stream, ipl_data):
+        if isinstance(ipl_data, BinaryIPLData):
+            instances = ipl_data.instances
+            cars = ipl_data.cars
+        else:
+            instances = InstanceRecords.from_instances(ipl_data.object_instances)
+            cars = CarRecords()
+
+        header_size = struct.calcsize(BinaryIPLData.header_format)
+        inst_offset = header_size
+        cars_offset = inst_offset + len(instances) * instances.record_size
+
+        counts = [len(instances), 0, 0, 0, len(cars), 0]
+        offsets = [inst_offset, 0, 0, 0, 0, 0, 0, 0, cars_offset if len(cars) else 0, 0, 0, 0]
+        file_stream.write(struct.pack(BinaryIPLData.header_format, b"bnry", *(counts + offsets)))
+        file_stream.write(instances.tobytes())
+        file_stream.write(cars.tobytes())
+
+    @staticmethod
+    def write_ipl_data(filename, game_id, ipl_data, binary=False):
+        if binary:
+            with open(filename, "wb") as file_stream:
+                MapDataUtility.write_binary_ipl_to_stream(file_stream, ipl_data)
+            return
         with open(filename, "w") as file_stream:
             MapDataUtility.write_text_ipl_to_stream(file_stream, game_id, ipl_data)
 
+    @staticmethod
+    def write_streamed_ipl_data(directory, name, game_id, map_data, cell_size=500.0, max_instances=1000):
+        split = StreamedIPLSplit.build(map_data.object_instances, cell_size, max_instances)
+        paths = split.write(directory, name, game_id, map_data.cull_instances)
+        print("Wrote %s: %d main instances, %d streamed sectors" % (
+            name, len(split.main_instances), len(split.sectors)))
+        return split, paths
+
+# Differences between two loads of the same map, indices refer to the old
+# and new object_instances lists
+#######################################################
+class MapDiff(object):
+
+    def __init__(self):
+        # Paths, or (img path, entry name) for an IPL read from gta3.img
+        self.changed_files = []
+        self.added = []
+        self.removed = []
+        # (old index, new index) of instances placed or LOD linked differently
+        self.moved = []
+        # old index -> new index of every instance kept, moved or not
+        self.remap = {}
+        self.added_models = []
+        self.removed_models = []
+        self.changed_models = []
+        self.cull_changed = False
+
+    #######################################################
+    def is_empty(self):
+        return not (self.added or self.removed or self.moved or self.added_models or
+                    self.removed_models or self.changed_models or self.cull_changed or
+                    any(old != new for old, new in self.remap.items()))
+
+# Reloads a map after edits, parsing only the files that changed
+#
+# Files are compared by size and mtime first and by content hash when those
+# differ, so touching a file without editing it re-parses nothing. The
+# MapData of the first load is patched in place and each reload returns a
+# MapDiff the scene can be updated from.
+#######################################################
+class MapReloader(object):
+
+    def __init__(self, game_id, game_root, ipl_section, is_custom_ipl, typed=False, cache_dir=None,
+                 workers=None, use_processes=False, col_paths=()):
+        self.game_id = game_id
+        self.game_root = game_root
+        self.ipl_section = ipl_section
+        self.is_custom_ipl = is_custom_ipl
+        self.typed = typed
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.use_processes = use_processes
+        self.col_paths = col_paths
+        self.map_data = None
+        # full path -> (size, mtime_ns, sha1), or for an IPL inside gta3.img
+        # (img path, entry name) -> (offset, size, sha1, img stamp)
+        self.stamps = {}
+
+    #######################################################
+    @staticmethod
+    def hash_file(filepath, chunk_size=1 << 20):
+        digest = hashlib.sha1()
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    #######################################################
+    @staticmethod
+    def entry_stamp(source, previous=None):
+        img_path, entry_name = source
+        try:
+            img_stamp = MapDataCache.source_stamp(img_path)
+        except OSError:
+            return None
+        if previous is not None and previous[3] == img_stamp:
+            return previous
+        try:
+            with img.open(img_path) as archive:
+                idx = archive.find_entry_idx(entry_name)
+                if idx < 0:
+                    return None
+                entry = archive.entries[idx]
+                data = archive.read_entry(idx)[1]
+                digest = hashlib.sha1(data).hexdigest()
+                data.release()
+        except (OSError, IOError):
+            return None
+        return entry.offset, entry.size, digest, img_stamp
+
+    #######################################################
+    @staticmethod
+    def file_stamp(source, previous=None):
+        if isinstance(source, tuple):
+            return MapReloader.entry_stamp(source, previous)
+        try:
+            size, mtime = MapDataCache.source_stamp(source)
+        except OSError:
+            return None
+        if previous is not None and previous[:2] == (size, mtime):
+            return previous
+        return size, mtime, MapReloader.hash_file(source)
+
+    #######################################################
+    def ipl_source(self):
+        fullpath = MapDataUtility.get_full_path(self.game_root, self.ipl_section)
+        if not os.path.isfile(fullpath):
+            # Binary IPLs are streamed from gta3.img, watch just their entry
+            return (MapDataUtility.get_full_path(self.game_root, "models/gta3.img"),
+                    os.path.basename(self.ipl_section))
+        return fullpath
+
+    #######################################################
+    def watched_files(self):
+        return [self.ipl_source()] + [job[0] for job, _ in self.map_data.ide_files]
+
+    #######################################################
+    def load(self):
+        self.map_data = MapDataUtility.load_map_data(
+            self.game_id, self.game_root, self.ipl_section, self.is_custom_ipl, self.typed, self.cache_dir,
+            workers=self.workers, use_processes=self.use_processes, col_paths=self.col_paths)
+        self.stamps = dict((p, self.file_stamp(p)) for p in self.watched_files())
+        return self.map_data
+
+    #######################################################
+    def changed_files(self):
+        changed = []
+        for filepath, stamp in self.stamps.items():
+            new_stamp = self.file_stamp(filepath, stamp)
+            if new_stamp is None or stamp is None or new_stamp[2] != stamp[2]:
+                changed.append(filepath)
+            else:
+                # Same content, remember the new stamp so it is not hashed again
+                self.stamps[filepath] = new_stamp
+        return changed
+
+    #######################################################
+    def reload(self):
+        # Returns None when nothing changed
+        if self.map_data is None:
+            self.load()
+            return None
+
+        changed = self.changed_files()
+        if not changed:
+            return None
+
+        utility = MapDataUtility
+        current = self.map_data
+        data = map_data.data[self.game_id]
+        ipl_path = self.ipl_source()
+
+        old_instances = list(current.object_instances)
+        old_cull = list(current.cull_instances)
+        new_instances = old_instances
+        new_cull = old_cull
+
+        if ipl_path in changed:
+            ipl = utility.load_ipl_data(self.game_root, self.ipl_section, data["structures"],
+                                        data["IPL_aliases"], self.typed, self.cache_dir)
+            new_instances = ipl.get("inst", [])
+            new_cull = ipl.get("cull", [])
+
+        ide_changed = False
+        for ide_file in current.ide_files:
+            if ide_file[0][0] in changed:
+                ide_file[1] = read_file_job(ide_file[0])
+                ide_changed = True
+
+        ide = utility.merge_ide_files(current.ide_files, verbose=False)
+        object_data = utility.merge_object_data(ide, verbose=False)
+
+        # The IPL may now place models none of the loaded IDEs define
+        def undefined(instances, object_data):
+            return set(i for i in utility.instance_model_ids(instances)
+                       if model_lookup(object_data, i) is None)
+
+        if undefined(new_instances, object_data) - undefined(old_instances, current.object_data):
+            print("MapReloader: new model IDs referenced, loading the map again")
+            full = MapDataUtility.load_map_data(
+                self.game_id, self.game_root, self.ipl_section, self.is_custom_ipl, self.typed, self.cache_dir,
+            workers=self.workers, use_processes=self.use_processes, col_paths=self.col_paths)
+            new_instances = full.object_instances
+            new_cull = full.cull_instances
+            object_data = full.object_data
+            current.ide_files = full.ide_files
+            current.model_registry = full.model_registry
+        elif ide_changed:
+            # The registry spans every IDE, not only the files loaded for the IPL
+            current.model_registry = utility.load_model_registry(
+                self.game_root, current.ide_paths, self.cache_dir, current.col_paths)
+
+        diff = MapDiff()
+        diff.changed_files = changed
+        self.diff_object_data(current.object_data, object_data, diff)
+        self.diff_instances(old_instances, new_instances, diff)
+        diff.cull_changed = old_cull != list(new_cull)
+
+        # Patch in place so references held by the caller stay valid
+        current.object_instances[:] = new_instances
+        current.cull_instances[:] = new_cull
+        current.spatial_index = None
+        current.lod_graph = None
+        current.cull_index = None
+
+        self.stamps = dict((p, self.file_stamp(p, self.stamps.get(p))) for p in self.watched_files())
+        return diff
+
+    #######################################################
+    @staticmethod
+    def diff_object_data(object_data, new_object_data, diff):
+        for model_id in list(object_data):
+            if model_id not in new_object_data:
+                diff.removed_models.append(model_id)
+                del object_data[model_id]
+        for model_id, entry in new_object_data.items():
+            old = object_data.get(model_id)
+            if old is None:
+                diff.added_models.append(model_id)
+            elif old != entry:
+                diff.changed_models.append(model_id)
+            else:
+                continue
+            object_data[model_id] = entry
+
+    #######################################################
+    @staticmethod
+    def placement_key(inst):
+        fields = inst._fields
+        return tuple(v for f, v in zip(fields, inst) if f != "lod" and not f.startswith(("pos", "rot")))
+
+    #######################################################
+    @staticmethod
+    def diff_instances(old_instances, new_instances, diff):
+        # Unchanged instances are paired first, so removing or inserting one
+        # copy of a model placed many times does not shift the other copies.
+        # Only the leftovers are paired by everything but the placement
+        def queues(indices, key):
+            result = {}
+            for idx in indices:
+                result.setdefault(key(old_instances[idx]), []).append(idx)
+            for indices in result.values():
+                indices.reverse()
+            return result
+
+        unmatched = queues(range(len(old_instances)), tuple)
+        leftovers = []
+        for new_idx, inst in enumerate(new_instances):
+            candidates = unmatched.get(tuple(inst))
+            if candidates:
+                diff.remap[candidates.pop()] = new_idx
+            else:
+                leftovers.append(new_idx)
+
+        unmatched = queues(sorted(i for indices in unmatched.values() for i in indices), MapReloader.placement_key)
+        for new_idx in leftovers:
+            inst = new_instances[new_idx]
+            candidates = unmatched.get(MapReloader.placement_key(inst))
+            if not candidates:
+                diff.added.append(new_idx)
+                continue
+            old_idx = candidates.pop()
+            diff.remap[old_idx] = new_idx
+            diff.moved.append((old_idx, new_idx))
+
+        diff.removed = sorted(i for indices in unmatched.values() for i in indices)
+
+#######################################################
+def structure_spec(data_structures):
+    return tuple((key, ds.__name__, tuple(ds._fields)) for key, ds in sorted(data_structures.items()))
+
+# Structures rebuilt in worker processes, per structure_spec
+process_structures = {}
+
+#######################################################
+def read_file_process_job(job):
+    # Module level so ProcessPoolExecutor can pickle it. The map_data classes
+    # cannot be pickled, so structures arrive as (key, name, fields) and the
+    # parsed entries go back as plain tuples
+    filepath, spec, aliases, typed, cache_dir = job
+    data_structures = process_structures.get(spec)
+    if data_structures is None:
+        data_structures = dict((key, namedtuple(name, fields)) for key, name, fields in spec)
+        process_structures[spec] = data_structures
+    return pack_sections(read_file_job((filepath, data_structures, aliases, typed, cache_dir)))
+
+#######################################################
+def read_file_job(job):
+    filepath, data_structures, aliases, typed, cache_dir = job
+    if cache_dir is not None:
+        return MapDataCache(cache_dir).read_file(filepath, data_structures, aliases, typed, verbose=False)
+    return MapDataUtility.read_file(filepath, data_structures, aliases, typed, verbose=False)
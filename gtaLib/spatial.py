@@ -0,0 +1,159 @@
+# GTA DragonFF spatial index utility (2.79 compatible)
+# Python 3.5 safe: no dataclasses, no f-strings
+from __future__ import absolute_import, print_function
+
+from math import floor, sqrt
+
+# Uniform grid over the XY plane for points with optional bounding radii
+#
+# Items are bucketed into every cell their bounding circle touches, queries
+# return sorted item indices. Cells are addressed by (column, row) keys so
+# callers can stream tiles and their neighbours incrementally.
+#######################################################
+class GridIndex(object):
+
+    def __init__(self, cell_size=200.0):
+        self.cell_size = float(cell_size)
+        self.xs = []
+        self.ys = []
+        self.zs = []
+        self.radii = []
+        self.cells = {}
+        # cell key -> [min z, max z] of the items in it
+        self.cell_z = {}
+
+    #######################################################
+    def __len__(self):
+        return len(self.xs)
+
+    #######################################################
+    def cell_of(self, x, y):
+        return int(floor(x / self.cell_size)), int(floor(y / self.cell_size))
+
+    #######################################################
+    def build(self, xs, ys, zs, radii=None):
+        self.xs = list(xs)
+        self.ys = list(ys)
+        self.zs = list(zs)
+        self.radii = list(radii) if radii is not None else [0.0] * len(self.xs)
+        self.cells = {}
+        self.cell_z = {}
+        for idx in range(len(self.xs)):
+            self.insert_cells(idx)
+        return self
+
+    #######################################################
+    def insert(self, x, y, z, radius=0.0):
+        self.xs.append(x)
+        self.ys.append(y)
+        self.zs.append(z)
+        self.radii.append(radius)
+        idx = len(self.xs) - 1
+        self.insert_cells(idx)
+        return idx
+
+    #######################################################
+    def insert_cells(self, idx):
+        x, y, z, r = self.xs[idx], self.ys[idx], self.zs[idx], self.radii[idx]
+        min_cx, min_cy = self.cell_of(x - r, y - r)
+        max_cx, max_cy = self.cell_of(x + r, y + r)
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                key = (cx, cy)
+                self.cells.setdefault(key, []).append(idx)
+                zrange = self.cell_z.get(key)
+                if zrange is None:
+                    self.cell_z[key] = [z - r, z + r]
+                else:
+                    zrange[0] = min(zrange[0], z - r)
+                    zrange[1] = max(zrange[1], z + r)
+
+    #######################################################
+    def cells_in_box(self, min_x, min_y, max_x, max_y):
+        min_cx, min_cy = self.cell_of(min_x, min_y)
+        max_cx, max_cy = self.cell_of(max_x, max_y)
+        # Iterate whichever is smaller, the covered range or the occupied cells
+        if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) > len(self.cells):
+            return [k for k in self.cells
+                    if min_cx <= k[0] <= max_cx and min_cy <= k[1] <= max_cy]
+        return [(cx, cy) for cx in range(min_cx, max_cx + 1)
+                for cy in range(min_cy, max_cy + 1) if (cx, cy) in self.cells]
+
+    #######################################################
+    def neighbour_cells(self, cell, ring=1):
+        cx, cy = cell
+        return [(x, y) for x in range(cx - ring, cx + ring + 1)
+                for y in range(cy - ring, cy + ring + 1) if (x, y) in self.cells]
+
+    #######################################################
+    def cell_items(self, cells):
+        result = set()
+        for key in cells:
+            result.update(self.cells.get(key, ()))
+        return sorted(result)
+
+    #######################################################
+    def query_box(self, box_min, box_max):
+        min_x, min_y, min_z = box_min
+        max_x, max_y, max_z = box_max
+        result = set()
+        for key in self.cells_in_box(min_x, min_y, max_x, max_y):
+            for idx in self.cells[key]:
+                r = self.radii[idx]
+                if (self.xs[idx] + r >= min_x and self.xs[idx] - r <= max_x and
+                        self.ys[idx] + r >= min_y and self.ys[idx] - r <= max_y and
+                        self.zs[idx] + r >= min_z and self.zs[idx] - r <= max_z):
+                    result.add(idx)
+        return sorted(result)
+
+    #######################################################
+    def query_radius(self, center, radius):
+        x, y, z = center
+        result = set()
+        for key in self.cells_in_box(x - radius, y - radius, x + radius, y + radius):
+            for idx in self.cells[key]:
+                reach = radius + self.radii[idx]
+                dx = self.xs[idx] - x
+                dy = self.ys[idx] - y
+                dz = self.zs[idx] - z
+                if dx * dx + dy * dy + dz * dz <= reach * reach:
+                    result.add(idx)
+        return sorted(result)
+
+    #######################################################
+    def query_frustum(self, planes):
+        # planes are (nx, ny, nz, d), a point p is inside when n.p + d >= 0
+        result = set()
+        half = self.cell_size * 0.5
+        for key, items in self.cells.items():
+            zmin, zmax = self.cell_z[key]
+            cx = (key[0] + 0.5) * self.cell_size
+            cy = (key[1] + 0.5) * self.cell_size
+            cz = (zmin + zmax) * 0.5
+            hz = (zmax - zmin) * 0.5
+            if any(nx * cx + ny * cy + nz * cz + d < -(abs(nx) * half + abs(ny) * half + abs(nz) * hz)
+                   for nx, ny, nz, d in planes):
+                continue
+            for idx in items:
+                px, py, pz, r = self.xs[idx], self.ys[idx], self.zs[idx], self.radii[idx]
+                if all(nx * px + ny * py + nz * pz + d >= -r for nx, ny, nz, d in planes):
+                    result.add(idx)
+        return sorted(result)
+
+    #######################################################
+    def query_box_many(self, boxes):
+        return [self.query_box(box_min, box_max) for box_min, box_max in boxes]
+
+    #######################################################
+    def query_radius_many(self, centers, radius):
+        return [self.query_radius(center, radius) for center in centers]
+
+    #######################################################
+    def query_frustum_many(self, frustums):
+        return [self.query_frustum(planes) for planes in frustums]
+
+#######################################################
+def normalise_plane(plane):
+    nx, ny, nz, d = plane
+    length = sqrt(nx * nx + ny * ny + nz * nz)
+    return nx / length, ny / length, nz / length, d / length
@@ -0,0 +1,131 @@
+# GTA DragonFF visibility budget analysis (2.79 compatible)
+# Python 3.5 safe: no dataclasses, no f-strings
+from __future__ import absolute_import, print_function
+
+from array import array
+from math import floor
+
+from .map import instance_position, model_lookup
+from .spatial import GridIndex
+
+#######################################################
+def draw_distance(entry, default=300.0):
+    if entry is None:
+        return default
+    # Multi mesh objs entries carry one draw distance per mesh
+    values = [float(value) for field, value in zip(entry._fields, entry)
+              if field.startswith("drawDistance")]
+    return max(values) if values else default
+
+# Instances and triangles within draw distance of each sample point
+#######################################################
+class VisibilityReport(object):
+
+    def __init__(self, samples, counts, triangles):
+        self.samples = samples
+        self.counts = counts
+        self.triangles = triangles
+
+    #######################################################
+    def __len__(self):
+        return len(self.samples)
+
+    #######################################################
+    def peak(self):
+        if not self.samples:
+            return 0, 0
+        return max(self.counts), max(self.triangles)
+
+    #######################################################
+    def hotspots(self, limit=10, by_triangles=None):
+        # [(sample point, instance count, triangle count)], worst first. By
+        # default triangles rank first unless no triangle estimates were given
+        if by_triangles is None:
+            by_triangles = any(self.triangles)
+        first, second = (self.triangles, self.counts) if by_triangles else (self.counts, self.triangles)
+        order = sorted(range(len(self.samples)), key=lambda i: (-first[i], -second[i], i))[:limit]
+        return [(self.samples[i], self.counts[i], self.triangles[i]) for i in order]
+
+    #######################################################
+    def over_budget(self, max_instances=None, max_triangles=None):
+        return [
+            (self.samples[i], self.counts[i], self.triangles[i])
+            for i in range(len(self.samples))
+            if (max_instances is not None and self.counts[i] > max_instances) or
+               (max_triangles is not None and self.triangles[i] > max_triangles)
+        ]
+
+    #######################################################
+    def print_summary(self, limit=10):
+        peak_count, peak_triangles = self.peak()
+        print("Visibility: %d samples, peak %d instances, peak %d triangles" % (
+            len(self.samples), peak_count, peak_triangles))
+        for (x, y, _), count, triangles in self.hotspots(limit):
+            print("    (%.0f, %.0f): %d instances, %d triangles" % (x, y, count, triangles))
+
+#######################################################
+def sample_grid(bounds, spacing, sample_z=0.0):
+    min_x, min_y, max_x, max_y = bounds
+    columns = int(floor((max_x - min_x) / spacing)) + 1
+    rows = int(floor((max_y - min_y) / spacing)) + 1
+    return [(min_x + c * spacing, min_y + r * spacing, sample_z)
+            for r in range(rows) for c in range(columns)]
+
+#######################################################
+def analyse_visibility(map_data, spacing=100.0, model_triangles=None, default_triangles=0,
+                       default_draw_distance=300.0, sample_z=None, bounds=None, samples=None,
+                       cell_size=None):
+    """Count what a camera at each sample point would have to draw.
+
+    An instance counts when the sample lies within its model's draw distance,
+    measured in XY unless sample_z is given. A LOD is not counted where one of
+    its children is, as the game swaps it out for the HD model. Samples
+    default to a grid of the given spacing over the instance bounds.
+    """
+    instances = map_data.object_instances
+    positions = [instance_position(inst) for inst in instances]
+    if samples is None:
+        if not positions:
+            return VisibilityReport([], array("i"), array("q"))
+        if bounds is None:
+            bounds = (min(p[0] for p in positions), min(p[1] for p in positions),
+                      max(p[0] for p in positions), max(p[1] for p in positions))
+        samples = sample_grid(bounds, spacing, sample_z or 0.0)
+
+    object_data = map_data.object_data
+    distances = [draw_distance(model_lookup(object_data, inst.id), default_draw_distance)
+                 for inst in instances]
+    if model_triangles:
+        triangles = [model_lookup(model_triangles, inst.id, default_triangles) for inst in instances]
+    else:
+        triangles = [default_triangles] * len(instances)
+    parents = map_data.get_lod_graph().parents
+
+    # Each instance is bucketed into every cell its draw distance reaches,
+    # so a sample only has to test the instances of its own cell
+    index = GridIndex(cell_size or max(spacing, 200.0)).build(
+        [p[0] for p in positions], [p[1] for p in positions], [p[2] for p in positions], distances)
+    by_cell = {}
+    for i, sample in enumerate(samples):
+        by_cell.setdefault(index.cell_of(sample[0], sample[1]), []).append(i)
+
+    counts = array("i", [0] * len(samples))
+    totals = array("q", [0] * len(samples))
+    for key, sample_indices in by_cell.items():
+        candidates = [(idx, positions[idx], distances[idx] * distances[idx])
+                      for idx in index.cells.get(key, ())]
+        for i in sample_indices:
+            x, y, z = samples[i]
+            visible = set()
+            for idx, (px, py, pz), reach in candidates:
+                dx = px - x
+                dy = py - y
+                dz = pz - z if sample_z is not None else 0.0
+                if dx * dx + dy * dy + dz * dz <= reach:
+                    visible.add(idx)
+            hidden = set(parents[idx] for idx in visible if parents[idx] >= 0)
+            visible.difference_update(hidden)
+            counts[i] = len(visible)
+            totals[i] = sum(triangles[idx] for idx in visible)
+
+    return VisibilityReport(samples, counts, totals)
@@ -5,7 +5,13 @@
 # ------------------------------------------------------------
 
 from __future__ import absolute_import, print_function
+import ast
+import mmap
 import os
+import struct
+import sys
+from array import array
+from itertools import chain
 
 def read_heights(filepath):
     """Read numeric height values from a .dat or .txt file."""
@@ -40,3 +46,488 @@ def write_heights(filepath, data):
     except Exception as e:
         print("heights.py: write_heights failed:", e)
 
+
+
+class Heightmap(object):
+    """Row major grid of float32 heights, optionally backed by a memory map."""
+
+    def __init__(self, data, rows, cols, mapping=None):
+        if len(data) != rows * cols:
+            raise ValueError("heights.py: %d values do not fill a %dx%d grid" % (len(data), rows, cols))
+        self.data = data
+        self.rows = rows
+        self.cols = cols
+        self._map = mapping
+
+    @property
+    def shape(self):
+        return self.rows, self.cols
+
+    def __getitem__(self, key):
+        row, col = key
+        return self.data[row * self.cols + col]
+
+    def row(self, row):
+        return self.data[row * self.cols:(row + 1) * self.cols]
+
+    def tolist(self):
+        return [list(self.row(r)) for r in range(self.rows)]
+
+    def close(self):
+        if self._map is not None:
+            if isinstance(self.data, memoryview):
+                self.data.release()
+            self._map.close()
+            self._map = None
+
+
+NPY_MAGIC = b"\x93NUMPY"
+
+
+def parse_heights(filepath):
+    """Parse a text height grid in one pass, raising ValueError on ragged or bad rows."""
+    with open(filepath, "rb") as f:
+        lines = f.read().splitlines()
+
+    rows = []
+    line_numbers = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line[:1] in (b"#", b";"):
+            continue
+        rows.append(line.split())
+        line_numbers.append(number)
+
+    if not rows:
+        return Heightmap(array("f"), 0, 0)
+
+    cols = len(rows[0])
+    for number, row in zip(line_numbers, rows):
+        if len(row) != cols:
+            raise ValueError("heights.py: %s line %d has %d values, expected %d"
+                             % (filepath, number, len(row), cols))
+    try:
+        data = array("f", map(float, chain.from_iterable(rows)))
+    except ValueError:
+        for number, row in zip(line_numbers, rows):
+            try:
+                [float(v) for v in row]
+            except ValueError:
+                raise ValueError("heights.py: %s line %d is not numeric" % (filepath, number))
+        raise
+    return Heightmap(data, len(rows), cols)
+
+
+def write_npy(filepath, heightmap):
+    """Write a heightmap as a version 1.0 .npy file of little endian float32."""
+    header = "{'descr': '<f4', 'fortran_order': False, 'shape': (%d, %d), }" % heightmap.shape
+    # Magic, version and length prefix take 10 bytes, the data starts 64 byte aligned
+    padding = 64 - (10 + len(header) + 1) % 64
+    header = (header + " " * padding + "\n").encode("latin-1")
+
+    data = array("f", heightmap.data)
+    if sys.byteorder != "little":
+        data.byteswap()
+
+    temp_path = "%s.%d.tmp" % (filepath, os.getpid())
+    with open(temp_path, "wb") as f:
+        f.write(NPY_MAGIC + b"\x01\x00" + struct.pack("<H", len(header)) + header)
+        f.write(data.tobytes())
+    os.replace(temp_path, filepath)
+
+
+def read_npy(filepath):
+    """Memory map a float32 .npy file written by write_npy (or numpy.save)."""
+    with open(filepath, "rb") as f:
+        if f.read(6) != NPY_MAGIC:
+            raise ValueError("heights.py: %s is not a .npy file" % filepath)
+        major = f.read(2)[0]
+        if major == 1:
+            header_length = struct.unpack("<H", f.read(2))[0]
+        else:
+            header_length = struct.unpack("<I", f.read(4))[0]
+        offset = f.tell() + header_length
+        header = ast.literal_eval(f.read(header_length).decode("latin-1"))
+        if header["descr"] != "<f4" or header["fortran_order"] or len(header["shape"]) != 2:
+            raise ValueError("heights.py: %s is not a 2D little endian float32 array" % filepath)
+        rows, cols = header["shape"]
+
+        if rows * cols == 0:
+            return Heightmap(array("f"), rows, cols)
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if sys.byteorder != "little":
+        data = array("f", mapping[offset:offset + rows * cols * 4])
+        data.byteswap()
+        mapping.close()
+        return Heightmap(data, rows, cols)
+    return Heightmap(memoryview(mapping)[offset:offset + rows * cols * 4].cast("f"), rows, cols, mapping)
+
+
+def sidecar_path(filepath):
+    return filepath + ".npy"
+
+
+def load_heights(filepath, use_cache=True):
+    """Load a height grid as a Heightmap, caching it in a .npy sidecar.
+
+    The sidecar is given the source file's mtime and reused as long as the
+    two match, so edits to the text file are picked up on the next load.
+    """
+    if filepath.lower().endswith(".npy"):
+        return read_npy(filepath)
+
+    source_mtime = os.stat(filepath).st_mtime_ns
+    sidecar = sidecar_path(filepath)
+    if use_cache:
+        try:
+            if os.stat(sidecar).st_mtime_ns == source_mtime:
+                return read_npy(sidecar)
+        except (OSError, IOError, ValueError, KeyError, SyntaxError):
+            pass
+
+    heightmap = parse_heights(filepath)
+    if use_cache:
+        try:
+            write_npy(sidecar, heightmap)
+            os.utime(sidecar, ns=(source_mtime, source_mtime))
+        except (OSError, IOError) as e:
+            print("heights.py: could not write sidecar", sidecar, e)
+    return heightmap
+
+
+TILED_MAGIC = b"DFTH"
+TILED_HEADER = "<4sIIIII"
+TILED_LEVEL = "<IIQQQ"
+TILED_STATS = ("min", "max", "mean")
+
+
+def _float_bytes(values):
+    data = array("f", values)
+    if sys.byteorder != "little":
+        data.byteswap()
+    return data.tobytes()
+
+
+def _reduce_level(rows, cols, planes):
+    """Halve (min, max, mean) planes of a rows x cols level, edges are clamped."""
+    new_rows = (rows + 1) // 2
+    new_cols = (cols + 1) // 2
+    result = tuple(array("f") for _ in TILED_STATS)
+    for r in range(new_rows):
+        r0 = 2 * r * cols
+        r1 = min(2 * r + 1, rows - 1) * cols
+        for plane, out, reduce_fn in zip(planes, result, (min, max, None)):
+            a = list(plane[r0:r0 + cols])
+            b = list(plane[r1:r1 + cols])
+            if cols % 2:
+                a.append(a[-1])
+                b.append(b[-1])
+            quads = (a[0::2], a[1::2], b[0::2], b[1::2])
+            if reduce_fn is None:
+                out.extend([(w + x + y + z) * 0.25 for w, x, y, z in zip(*quads)])
+            else:
+                out.extend(map(reduce_fn, *quads))
+    return new_rows, new_cols, result
+
+
+class TiledHeightmap(object):
+    """Heightmap stored as fixed size tiles in one memory mapped file.
+
+    Level 0 holds the full resolution heights tile by tile, so a region read
+    only touches the pages of the tiles it overlaps. Each further level
+    halves the resolution and keeps min, max and mean planes of the level
+    below, for previews and culling of large areas.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._file = open(filepath, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header_size = struct.calcsize(TILED_HEADER)
+        magic, version, self.rows, self.cols, self.tile_size, level_count = struct.unpack_from(
+            TILED_HEADER, self._map, 0)
+        if magic != TILED_MAGIC or version != 1:
+            self.close()
+            raise ValueError("heights.py: %s is not a tiled heightmap" % filepath)
+
+        # (rows, cols, {stat: byte offset}) per level, level 0 is the tile data
+        self.levels = []
+        pos = header_size
+        for _ in range(level_count):
+            rows, cols, min_offset, max_offset, mean_offset = struct.unpack_from(TILED_LEVEL, self._map, pos)
+            self.levels.append((rows, cols, dict(zip(TILED_STATS, (min_offset, max_offset, mean_offset)))))
+            pos += struct.calcsize(TILED_LEVEL)
+        self.tiles_offset = self.levels[0][2]["mean"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def build(heightmap, filepath, tile_size=64):
+        """Write heightmap in the tiled layout and open the result."""
+        rows, cols = heightmap.shape
+        if rows == 0 or cols == 0:
+            raise ValueError("heights.py: cannot tile an empty heightmap")
+        tile_rows = (rows + tile_size - 1) // tile_size
+        tile_cols = (cols + tile_size - 1) // tile_size
+
+        # Level 0 stats are the heights themselves, the pyramid starts at level 1
+        data = heightmap.data
+        levels = [(rows, cols, None)]
+        planes = (data, data, data)
+        level_rows, level_cols = rows, cols
+        while level_rows > 1 or level_cols > 1:
+            level_rows, level_cols, planes = _reduce_level(level_rows, level_cols, planes)
+            levels.append((level_rows, level_cols, planes))
+
+        header_size = struct.calcsize(TILED_HEADER) + len(levels) * struct.calcsize(TILED_LEVEL)
+        tile_bytes = tile_size * tile_size * 4
+        offset = header_size + tile_rows * tile_cols * tile_bytes
+        table = [struct.pack(TILED_LEVEL, rows, cols, header_size, header_size, header_size)]
+        for level_rows, level_cols, _ in levels[1:]:
+            plane_bytes = level_rows * level_cols * 4
+            table.append(struct.pack(TILED_LEVEL, level_rows, level_cols,
+                                     offset, offset + plane_bytes, offset + 2 * plane_bytes))
+            offset += 3 * plane_bytes
+
+        temp_path = "%s.%d.tmp" % (filepath, os.getpid())
+        with open(temp_path, "wb") as f:
+            f.write(struct.pack(TILED_HEADER, TILED_MAGIC, 1, rows, cols, tile_size, len(levels)))
+            f.write(b"".join(table))
+            for tr in range(tile_rows):
+                for tc in range(tile_cols):
+                    c0 = tc * tile_size
+                    c1 = min(c0 + tile_size, cols)
+                    tile = array("f")
+                    for r in range(tr * tile_size, (tr + 1) * tile_size):
+                        start = min(r, rows - 1) * cols
+                        segment = data[start + c0:start + c1]
+                        tile.extend(segment)
+                        # Pad edge tiles by repeating the last column / row
+                        tile.extend([segment[-1]] * (tile_size - (c1 - c0)))
+                    f.write(_float_bytes(tile))
+            for _, _, level_planes in levels[1:]:
+                for plane in level_planes:
+                    f.write(_float_bytes(plane))
+        os.replace(temp_path, filepath)
+        return TiledHeightmap(filepath)
+
+    @property
+    def shape(self):
+        return self.rows, self.cols
+
+    def level_count(self):
+        return len(self.levels)
+
+    def level_shape(self, level):
+        return self.levels[level][0], self.levels[level][1]
+
+    def level_for_size(self, max_size):
+        """Finest level whose larger side is at most max_size cells."""
+        for level, (rows, cols, _) in enumerate(self.levels):
+            if max(rows, cols) <= max_size:
+                return level
+        return len(self.levels) - 1
+
+    def tiles_in_region(self, row, col, rows, cols):
+        """(tile row, tile column) of the level 0 tiles overlapping a region."""
+        row, col, rows, cols = self._clip(0, row, col, rows, cols)
+        if rows == 0 or cols == 0:
+            return []
+        size = self.tile_size
+        return [(tr, tc)
+                for tr in range(row // size, (row + rows - 1) // size + 1)
+                for tc in range(col // size, (col + cols - 1) // size + 1)]
+
+    def read_tile(self, tile_row, tile_col):
+        size = self.tile_size
+        return self.read_region(tile_row * size, tile_col * size, size, size)
+
+    def preview(self, level, stat="mean"):
+        rows, cols = self.level_shape(level)
+        return self.read_region(0, 0, rows, cols, level, stat)
+
+    def _clip(self, level, row, col, rows, cols):
+        level_rows, level_cols = self.level_shape(level)
+        row0 = max(row, 0)
+        col0 = max(col, 0)
+        row1 = min(row + rows, level_rows)
+        col1 = min(col + cols, level_cols)
+        return row0, col0, max(row1 - row0, 0), max(col1 - col0, 0)
+
+    def read_region(self, row, col, rows, cols, level=0, stat="mean"):
+        """Heights of a region of a level, clipped to the grid.
+
+        Level 0 ignores stat; coarser levels return the min, max or mean
+        of the cells they cover.
+        """
+        row, col, rows, cols = self._clip(level, row, col, rows, cols)
+        out = bytearray(rows * cols * 4)
+        source = self._map
+
+        if level == 0:
+            size = self.tile_size
+            tile_cols = (self.cols + size - 1) // size
+            tile_bytes = size * size * 4
+            for tr, tc in self.tiles_in_region(row, col, rows, cols):
+                tile_offset = self.tiles_offset + (tr * tile_cols + tc) * tile_bytes
+                r0 = max(row, tr * size)
+                r1 = min(row + rows, (tr + 1) * size)
+                c0 = max(col, tc * size)
+                c1 = min(col + cols, (tc + 1) * size)
+                length = (c1 - c0) * 4
+                for r in range(r0, r1):
+                    src = tile_offset + ((r - tr * size) * size + (c0 - tc * size)) * 4
+                    dst = ((r - row) * cols + (c0 - col)) * 4
+                    out[dst:dst + length] = source[src:src + length]
+        else:
+            level_cols = self.levels[level][1]
+            plane_offset = self.levels[level][2][stat]
+            length = cols * 4
+            for r in range(rows):
+                src = plane_offset + ((row + r) * level_cols + col) * 4
+                out[r * length:(r + 1) * length] = source[src:src + length]
+
+        data = array("f")
+        data.frombytes(bytes(out))
+        if sys.byteorder != "little":
+            data.byteswap()
+        return Heightmap(data, rows, cols)
+
+
+def _cubic(p0, p1, p2, p3, t):
+    # Catmull-Rom through p1 (t = 0) and p2 (t = 1)
+    return p1 + 0.5 * t * (p2 - p0 + t * (2.0 * p0 - 5.0 * p1 + 4.0 * p2 - p3 + t * (3.0 * (p1 - p2) + p3 - p0)))
+
+
+class HeightSampler(object):
+    """Bilinear / bicubic height lookups on a Heightmap in world units.
+
+    Cell (row, col) lies at origin + (col * cell_x, row * cell_y); pass a
+    negative cell_y for grids whose first row is the northern edge.
+    Positions outside the grid are clamped to its border.
+    """
+
+    def __init__(self, heightmap, origin=(0.0, 0.0), cell_size=1.0):
+        if isinstance(cell_size, (tuple, list)):
+            self.cell_x, self.cell_y = float(cell_size[0]), float(cell_size[1])
+        else:
+            self.cell_x = self.cell_y = float(cell_size)
+        self.heightmap = heightmap
+        self.origin = (float(origin[0]), float(origin[1]))
+
+    @staticmethod
+    def from_tiled(tiled, xs, ys, origin=(0.0, 0.0), cell_size=1.0, level=0):
+        """Sampler over just the part of a TiledHeightmap that xs / ys fall in."""
+        probe = HeightSampler(Heightmap(array("f"), 0, 0), origin, cell_size)
+        cols = [(x - probe.origin[0]) / probe.cell_x for x in xs]
+        rows = [(y - probe.origin[1]) / probe.cell_y for y in ys]
+        if not cols:
+            return probe
+        # A level cell is the mean of a 2 ** level block of source cells and
+        # lies at the block's centre, (r + 0.5) * scale - 0.5 in source cells.
+        # Keep a border for bicubic
+        scale = float(1 << level)
+        shift = (scale - 1.0) * 0.5
+        row0 = max(int((min(rows) - shift) / scale) - 2, 0)
+        col0 = max(int((min(cols) - shift) / scale) - 2, 0)
+        row1 = int((max(rows) - shift) / scale) + 3
+        col1 = int((max(cols) - shift) / scale) + 3
+        region = tiled.read_region(row0, col0, row1 - row0, col1 - col0, level)
+        return HeightSampler(region,
+                             (probe.origin[0] + (col0 * scale + shift) * probe.cell_x,
+                              probe.origin[1] + (row0 * scale + shift) * probe.cell_y),
+                             (probe.cell_x * scale, probe.cell_y * scale))
+
+    def sample(self, xs, ys, method="bilinear"):
+        if method == "bilinear":
+            return self.sample_bilinear(xs, ys)
+        if method == "bicubic":
+            return self.sample_bicubic(xs, ys)
+        raise ValueError("heights.py: unknown sampling method %s" % method)
+
+    def _grid_coords(self, xs, ys):
+        rows, cols = self.heightmap.shape
+        if rows == 0 or cols == 0:
+            raise ValueError("heights.py: cannot sample an empty heightmap")
+        ox, oy = self.origin
+        max_col = float(cols - 1)
+        max_row = float(rows - 1)
+        gx = [min(max((x - ox) / self.cell_x, 0.0), max_col) for x in xs]
+        gy = [min(max((y - oy) / self.cell_y, 0.0), max_row) for y in ys]
+        return gx, gy
+
+    def sample_bilinear(self, xs, ys):
+        gx, gy = self._grid_coords(xs, ys)
+        data = self.heightmap.data
+        rows, cols = self.heightmap.shape
+        result = array("f", bytes(4 * len(gx)))
+        for i, (x, y) in enumerate(zip(gx, gy)):
+            c0 = min(int(x), cols - 2) if cols > 1 else 0
+            r0 = min(int(y), rows - 2) if rows > 1 else 0
+            c1 = min(c0 + 1, cols - 1)
+            r1 = min(r0 + 1, rows - 1)
+            tx = x - c0
+            ty = y - r0
+            top = data[r0 * cols + c0] + (data[r0 * cols + c1] - data[r0 * cols + c0]) * tx
+            bottom = data[r1 * cols + c0] + (data[r1 * cols + c1] - data[r1 * cols + c0]) * tx
+            result[i] = top + (bottom - top) * ty
+        return result
+
+    def sample_bicubic(self, xs, ys):
+        gx, gy = self._grid_coords(xs, ys)
+        data = self.heightmap.data
+        rows, cols = self.heightmap.shape
+        result = array("f", bytes(4 * len(gx)))
+        for i, (x, y) in enumerate(zip(gx, gy)):
+            c = min(int(x), cols - 1)
+            r = min(int(y), rows - 1)
+            tx = x - c
+            ty = y - r
+            column_index = [min(max(c + d, 0), cols - 1) for d in (-1, 0, 1, 2)]
+            values = []
+            for d in (-1, 0, 1, 2):
+                start = min(max(r + d, 0), rows - 1) * cols
+                values.append(_cubic(data[start + column_index[0]], data[start + column_index[1]],
+                                     data[start + column_index[2]], data[start + column_index[3]], tx))
+            result[i] = _cubic(values[0], values[1], values[2], values[3], ty)
+        return result
+
+
+def snap_instances_to_ground(map_data, sampler, offset=0.0, method="bilinear", indices=None):
+    """Set posZ of MapData.object_instances to the sampled ground height plus offset.
+
+    Returns the number of instances moved. String fields stay strings and
+    typed (float) fields stay floats.
+    """
+    instances = map_data.object_instances
+    if indices is None:
+        indices = range(len(instances))
+    indices = list(indices)
+    if not indices:
+        return 0
+
+    heights = sampler.sample([float(instances[i].posX) for i in indices],
+                             [float(instances[i].posY) for i in indices], method)
+    for i, z in zip(indices, heights):
+        inst = instances[i]
+        z += offset
+        instances[i] = inst._replace(posZ="%.4f" % z if isinstance(inst.posZ, str) else z)
+
+    # Positions changed, cached spatial queries are stale
+    if getattr(map_data, "spatial_index", None) is not None:
+        map_data.spatial_index = None
+    return len(indices)
@@ -0,0 +1,139 @@
+# Tests for the in place IMG v2 writer
+# Python 3.5 safe: no dataclasses, no f-strings
+from __future__ import absolute_import, print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gtaLib.img import ImgWriter, SECTOR_SIZE, img, sector_count
+
+
+#######################################################
+def payload(name, size):
+    pattern = name.encode("latin-1") + b"|"
+    return (pattern * (size // len(pattern) + 1))[:size]
+
+
+#######################################################
+class ImgWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "gta3.img")
+
+    #######################################################
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    #######################################################
+    def check_archive(self, expected):
+        # Contents match expected (name -> bytes) and no two entries overlap
+        with img.open(self.path) as archive:
+            self.assertEqual(archive.version, 2)
+            self.assertEqual(sorted(e.name for e in archive.entries), sorted(expected))
+            for name, data in expected.items():
+                view = archive.read_entry_by_name(name)
+                stored = bytes(view)
+                view.release()
+                self.assertEqual(len(stored), sector_count(len(data)) * SECTOR_SIZE)
+                self.assertEqual(stored[:len(data)], data)
+                self.assertEqual(stored[len(data):].strip(b"\0"), b"")
+            entries = list(archive.entries)
+
+        extents = sorted((e.offset, e.offset + e.size, e.name) for e in entries)
+        dir_sectors = ImgWriter.directory_sectors(len(entries))
+        if extents:
+            self.assertGreaterEqual(extents[0][0], dir_sectors, "entry overlaps the directory")
+        for (_, end, name), (start, _, next_name) in zip(extents, extents[1:]):
+            self.assertLessEqual(end, start, "%s overlaps %s" % (name, next_name))
+        return entries
+
+    #######################################################
+    def offsets(self, entries):
+        return dict((e.name, e.offset) for e in entries)
+
+    #######################################################
+    def test_add_replace_remove(self):
+        expected = {
+            "a.dff": payload("a", 5000),
+            "b.txd": payload("b", 3 * SECTOR_SIZE),
+            "c.col": payload("c", 100),
+        }
+        with ImgWriter(self.path) as writer:
+            for name, data in sorted(expected.items()):
+                writer.add(name, data)
+        before = self.offsets(self.check_archive(expected))
+
+        writer = ImgWriter(self.path)
+        # Smaller replacement stays in place, larger one has to move
+        expected["b.txd"] = payload("B", SECTOR_SIZE + 1)
+        expected["c.col"] = payload("C", 4 * SECTOR_SIZE)
+        writer.replace("B.TXD", expected["b.txd"])
+        writer.replace("c.col", expected["c.col"])
+        writer.remove("a.dff")
+        del expected["a.dff"]
+        writer.commit()
+        after = self.offsets(self.check_archive(expected))
+        self.assertEqual(after["b.txd"], before["b.txd"])
+        self.assertNotEqual(after["c.col"], before["c.col"])
+
+        # The sectors a.dff freed are reused instead of growing the archive
+        size = os.path.getsize(self.path)
+        expected["d.ifp"] = payload("d", SECTOR_SIZE)
+        with ImgWriter(self.path) as writer:
+            writer.add("d.ifp", expected["d.ifp"])
+        after = self.offsets(self.check_archive(expected))
+        self.assertEqual(after["d.ifp"], before["a.dff"])
+        self.assertEqual(os.path.getsize(self.path), size)
+
+    #######################################################
+    def test_directory_growth_relocates_first_entries(self):
+        # One directory sector holds 63 entries, the 64th needs a second one
+        per_sector = (SECTOR_SIZE - 8) // 32
+        expected = dict(("m%03d.dff" % i, payload("m%03d" % i, 700 + i)) for i in range(per_sector))
+        with ImgWriter(self.path) as writer:
+            for name in sorted(expected):
+                writer.add(name, expected[name])
+        entries = self.check_archive(expected)
+        self.assertEqual(min(e.offset for e in entries), 1)
+
+        expected["grow.dff"] = payload("grow", 10)
+        with ImgWriter(self.path) as writer:
+            writer.add("grow.dff", expected["grow.dff"])
+        entries = self.check_archive(expected)
+        self.assertEqual(ImgWriter.directory_sectors(len(entries)), 2)
+        self.assertGreaterEqual(min(e.offset for e in entries), 2)
+
+    #######################################################
+    def test_compact(self):
+        expected = dict(("e%d.dff" % i, payload("e%d" % i, (i + 1) * 1500)) for i in range(8))
+        with ImgWriter(self.path) as writer:
+            for name in sorted(expected):
+                writer.add(name, expected[name])
+
+        writer = ImgWriter(self.path)
+        for i in (1, 4, 6):
+            writer.remove("e%d.dff" % i)
+            del expected["e%d.dff" % i]
+        order = [e.name for e in writer.entries if e.name in expected]
+        writer.compact()
+
+        entries = self.check_archive(expected)
+        self.assertEqual([e.name for e in entries], order)
+        dir_sectors = ImgWriter.directory_sectors(len(entries))
+        used = sum(e.size for e in entries)
+        self.assertEqual(os.path.getsize(self.path), (dir_sectors + used) * SECTOR_SIZE)
+        extents = sorted((e.offset, e.size) for e in entries)
+        self.assertEqual(extents[0][0], dir_sectors)
+        for (offset, size), (next_offset, _) in zip(extents, extents[1:]):
+            self.assertEqual(offset + size, next_offset)
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+
+if __name__ == "__main__":
+    unittest.main()